@@ -1,3 +1,5 @@
 #!/bin/bash
 
-docker-compose exec backend-app sh -c "cd /app/database alembic revision --autogenerate"
+# Usage: ./migrations.sh                       -> alembic upgrade head
+#        ./migrations.sh revision --autogenerate -m "message"
+docker-compose exec backend-app sh -c "cd /app/database && alembic ${*:-upgrade head}"
@@ -1,23 +1,52 @@
-import datetime
-import logging
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from routes.user import router as user_router
 from routes.post import router as post_router
+from routes.metrics import router as metrics_router
 
-from routes.sync import router as sync_router
+from config import ENVIRONMENT, get_config
 
-from config import ENVIRONMENT
+from database.async_redis import init_redis_pool, close_redis_pool, get_local_cache, listen_for_invalidations
+from database.database import SQLAlchemyManager, db
 
+from services.authentication import password_executor
+from services.post_writer import run_post_writer
+
+from utils.serialization import FastJSONResponse
+from utils.log import configure_logging, shutdown_logging, RequestLogMiddleware
+from utils.instrumentation import InstrumentationMiddleware
+
+
+configure_logging(get_config().logging)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+	init_redis_pool()
+	SQLAlchemyManager.get_async_engine(db)
+	background = []
+	if get_local_cache() is not None:
+		background.append(asyncio.create_task(listen_for_invalidations()))
+	if get_config().posts.write_behind:
+		background.append(asyncio.create_task(run_post_writer()))
+	yield
+	# A batch cut short here is not acknowledged, so it is written again after restart
+	for task in background:
+		task.cancel()
+	await asyncio.gather(*background, return_exceptions=True)
+	await close_redis_pool()
+	await SQLAlchemyManager.dispose_all()
+	password_executor.shutdown(wait=False)
+	shutdown_logging()
 
-logging.basicConfig(
-	filename='app_{:%Y-%m-%d}.log'.format(datetime.datetime.now()),
-	format=u'%(filename)s [LINE:%(lineno)d] #%(levelname)-8s [%(asctime)s]  %(message)s',
-	level=logging.INFO,
-)
 
 app = FastAPI(
+	lifespan=lifespan,
+	default_response_class=FastJSONResponse,
 	docs_url="/swagger-docs",
 	openapi_prefix='/stats' if ENVIRONMENT == 'production' else '/dev',
 	swagger_ui_parameters={
@@ -32,6 +61,9 @@ app.add_middleware(
 	allow_methods=["*"],
 	allow_headers=["*"]
 )
+app.add_middleware(RequestLogMiddleware, access_log=get_config().logging.access_log)
+app.add_middleware(InstrumentationMiddleware)
 
 app.include_router(user_router, prefix="/user", tags=["User"])
 app.include_router(post_router, prefix="/post", tags=["Post"])
+app.include_router(metrics_router, prefix="/metrics", tags=["Metrics"])
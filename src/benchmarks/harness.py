@@ -0,0 +1,101 @@
+"""
+Shared setup for the benchmarks that drive the whole app in-process (load_test, replay):
+environment, schema, an optional fakeredis stand-in and latency summaries. percentile() is shared
+by the other benchmarks too; this module only imports the app lazily, so importing it is cheap.
+
+Project modules read their settings at import time, so call prepare_environment() before
+importing anything from the app, and only import it through running_app().
+"""
+import contextlib
+import math
+import os
+import platform
+import subprocess
+from typing import AsyncIterator
+
+
+def prepare_environment(database_url: str | None, workdir: str) -> str:
+	url = database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'benchmark.db')}"
+	os.environ["DATABASE_URL"] = url
+	defaults = {
+		"ENVIRONMENT": "benchmark",
+		"SECRET_KEY": "benchmark-secret",
+		"REDIS_HOST": "localhost",
+		"REDIS_PORT": "6379",
+		"REDIS_PASSWORD": "",
+		"REDIS_SSL_CERT": "",
+		"REDIS_USE_TLS": "",
+		"LOG_FILE": os.path.join(workdir, "app.log"),
+	}
+	for name, value in defaults.items():
+		os.environ.setdefault(name, value)
+	return url
+
+
+@contextlib.asynccontextmanager
+async def running_app(fake_redis: bool = True, reset: bool = False) -> AsyncIterator:
+	"""The FastAPI app with its lifespan started and the tables created (dropped first with `reset`)."""
+	from app import app
+	from database import Base
+	from database.async_redis import InstrumentedConnectionPool, init_redis_pool
+	from database.database import SQLAlchemyManager, db
+
+	if fake_redis:
+		from fakeredis import FakeServer
+		from fakeredis.aioredis import FakeConnection
+
+		init_redis_pool(InstrumentedConnectionPool(
+			connection_class=FakeConnection,
+			server=FakeServer(),
+			max_connections=50,
+			decode_responses=True,
+			encoding="utf-8",
+		))
+
+	engine = SQLAlchemyManager.get_async_engine(db)
+	if engine.dialect.name == "sqlite":
+		# Readers don't block the writer; without it concurrent requests fail with "database is locked"
+		async with engine.connect() as conn:
+			await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+	async with engine.begin() as conn:
+		if reset:
+			await conn.run_sync(Base.metadata.drop_all)
+		await conn.run_sync(Base.metadata.create_all)
+
+	async with app.router.lifespan_context(app):
+		yield app
+
+
+def percentile(values: list[float], q: float) -> float:
+	"""Nearest-rank percentile: the smallest value with at least `q` of the samples at or below it."""
+	ordered = sorted(values)
+	return round(ordered[max(math.ceil(len(ordered) * q) - 1, 0)], 3) if ordered else 0.0
+
+
+def summarize(latencies_ms: list[float], errors: int, elapsed: float) -> dict[str, float]:
+	return {
+		"requests": len(latencies_ms),
+		"errors": errors,
+		"error_rate": round(errors / len(latencies_ms), 4) if latencies_ms else 0.0,
+		"throughput_rps": round(len(latencies_ms) / elapsed, 1) if elapsed else 0.0,
+		"p50_ms": percentile(latencies_ms, 0.5),
+		"p95_ms": percentile(latencies_ms, 0.95),
+		"p99_ms": percentile(latencies_ms, 0.99),
+		"max_ms": round(max(latencies_ms), 3) if latencies_ms else 0.0,
+	}
+
+
+def run_metadata(database_url: str, fake_redis: bool) -> dict[str, str]:
+	"""Enough context to tell whether two reports are comparable."""
+	try:
+		commit = subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = "unknown"
+	return {
+		"commit": commit,
+		"python": platform.python_version(),
+		"database": database_url.split("://", 1)[0],
+		"redis": "fakeredis" if fake_redis else "redis",
+	}
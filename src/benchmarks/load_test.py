@@ -0,0 +1,234 @@
+"""
+Load test: boots the app in-process (httpx ASGI transport, no network) against SQLite/aiosqlite
+or any DATABASE_URL, with fakeredis standing in for Redis, seeds N users x M posts and drives
+sign-up, login, add, all and delete with a weighted mix from concurrent virtual users.
+Each virtual user follows its own seeded random sequence, so with the same arguments two runs
+issue the same requests and their reports can be compared across commits.
+
+    pip install -r benchmarks/requirements.txt
+    cd src && python -m benchmarks.load_test --users 100 --posts-per-user 200 --requests 5000 \\
+        --concurrency 20 --mix all=60,add=20,login=10,delete=5,sign-up=5 --output load.json
+
+With --database-url the tables are created in that database; --reset drops them first, so
+only point it at a throwaway one.
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from benchmarks.harness import prepare_environment, running_app, run_metadata, summarize
+
+
+PASSWORD = "load-test-password"
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do")
+SEED_CHUNK = 5_000
+
+
+@dataclass
+class VirtualUser:
+	login: str
+	token: str = ""
+	post_ids: list[int] = field(default_factory=list)
+	etag: str | None = None
+	sign_ups: int = 0
+
+
+@dataclass
+class OperationResults:
+	latencies_ms: list[float] = field(default_factory=list)
+	errors: int = 0
+
+
+def parse_mix(value: str) -> dict[str, int]:
+	mix = {}
+	for part in value.split(","):
+		name, _, weight = part.partition("=")
+		mix[name.strip()] = int(weight)
+	unknown = set(mix) - set(OPERATIONS)
+	if unknown:
+		raise argparse.ArgumentTypeError(f"unknown operations: {', '.join(sorted(unknown))}")
+	return mix
+
+
+def post_text(rng: random.Random) -> str:
+	return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 80)))
+
+
+async def seed(users: int, posts_per_user: int, rng: random.Random) -> list[VirtualUser]:
+	from sqlalchemy import insert, select
+
+	from database.database import SQLAlchemyManager, db
+	from models.post import Post
+	from models.user import User
+	from services.authentication import pwd_context
+
+	# Logins are unique per run, so seeding into a database that already has data does not collide
+	run = uuid.uuid4().hex[:8]
+	password_hash = pwd_context.hash(PASSWORD)
+
+	async with SQLAlchemyManager.get_async_session(db) as session:
+		await session.execute(insert(User), [
+			{"login": f"seed-{run}-{index}", "password_sha256": password_hash} for index in range(users)
+		])
+		rows = (await session.execute(select(User.id, User.login).where(User.login.like(f"seed-{run}-%")))).all()
+		by_login = {login: user_id for user_id, login in rows}
+		seeded = [VirtualUser(login=f"seed-{run}-{index}") for index in range(users)]
+
+		posts = [
+			{"user_id": by_login[user.login], "text": post_text(rng)}
+			for user in seeded
+			for _ in range(posts_per_user)
+		]
+		for start in range(0, len(posts), SEED_CHUNK):
+			await session.execute(insert(Post), posts[start:start + SEED_CHUNK])
+
+		owner = {by_login[user.login]: user for user in seeded}
+		owned = select(Post.id, Post.user_id).where(Post.user_id.in_(owner)).order_by(Post.id)
+		for post_id, user_id in await session.execute(owned):
+			owner[user_id].post_ids.append(post_id)
+		await session.commit()
+
+	return seeded
+
+
+def auth(user: VirtualUser) -> dict[str, str]:
+	return {"Authorization": f"Bearer {user.token}"}
+
+
+async def op_sign_up(client, user: VirtualUser, rng: random.Random):
+	user.sign_ups += 1
+	return await client.post("/user/sign-up", json={"login": f"{user.login}-new-{user.sign_ups}", "password": PASSWORD})
+
+
+async def op_login(client, user: VirtualUser, rng: random.Random):
+	return await client.post("/user/login", json={"login": user.login, "password": PASSWORD})
+
+
+async def op_add(client, user: VirtualUser, rng: random.Random):
+	response = await client.post("/post/add", json={"text": post_text(rng)}, headers=auth(user))
+	if response.status_code == 200:
+		user.post_ids.append(response.json()["data"])
+	return response
+
+
+async def op_all(client, user: VirtualUser, rng: random.Random):
+	# Like a browser: revalidate with the ETag of the last page seen
+	headers = auth(user)
+	if user.etag:
+		headers["If-None-Match"] = user.etag
+	response = await client.get("/post/all", params={"limit": 20}, headers=headers)
+	user.etag = response.headers.get("etag", user.etag)
+	return response
+
+
+async def op_delete(client, user: VirtualUser, rng: random.Random):
+	if not user.post_ids:
+		# Nothing left to delete; keep the request count and give it something for next time
+		return await op_add(client, user, rng)
+	post_id = user.post_ids.pop(rng.randrange(len(user.post_ids)))
+	return await client.request("DELETE", "/post", json={"post_id": post_id}, headers=auth(user))
+
+
+OPERATIONS = {
+	"sign-up": op_sign_up,
+	"login": op_login,
+	"add": op_add,
+	"all": op_all,
+	"delete": op_delete,
+}
+
+
+async def run_virtual_user(
+	client,
+	user: VirtualUser,
+	requests: int,
+	mix: dict[str, int],
+	seed_value: int,
+	results: dict[str, OperationResults],
+):
+	rng = random.Random(seed_value)
+	names, weights = list(mix), list(mix.values())
+	for _ in range(requests):
+		name = rng.choices(names, weights)[0]
+		started = time.perf_counter()
+		response = await OPERATIONS[name](client, user, rng)
+		latency_ms = (time.perf_counter() - started) * 1000
+		operation = results.setdefault(name, OperationResults())
+		operation.latencies_ms.append(latency_ms)
+		if response.status_code >= 400:
+			operation.errors += 1
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--users', type=int, default=100)
+	parser.add_argument('--posts-per-user', type=int, default=200)
+	parser.add_argument('--requests', type=int, default=5000, help='total, split evenly over the virtual users')
+	parser.add_argument('--concurrency', type=int, default=20, help='number of virtual users')
+	parser.add_argument('--mix', type=parse_mix, default="all=60,add=20,login=10,delete=5,sign-up=5")
+	parser.add_argument('--seed', type=int, default=1)
+	parser.add_argument('--database-url', default=None, help='async SQLAlchemy URL; a temporary SQLite file by default')
+	parser.add_argument('--real-redis', action='store_true', help='use REDIS_HOST/REDIS_PORT instead of fakeredis')
+	parser.add_argument('--reset', action='store_true', help='drop the tables before seeding')
+	parser.add_argument('--output', default=None, help='also write the JSON report to this file')
+	args = parser.parse_args()
+
+	import httpx
+
+	with tempfile.TemporaryDirectory() as workdir:
+		database_url = prepare_environment(args.database_url, workdir)
+		rng = random.Random(args.seed)
+
+		async with running_app(fake_redis=not args.real_redis, reset=args.reset) as app:
+			seeded = await seed(args.users, args.posts_per_user, rng)
+			virtual_users = [seeded[index % len(seeded)] for index in range(args.concurrency)]
+
+			async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-test") as client:
+				for user in virtual_users:
+					if not user.token:
+						user.token = (await op_login(client, user, rng)).json()["data"]
+
+				results: dict[str, OperationResults] = {}
+				per_user = args.requests // args.concurrency
+				started = time.perf_counter()
+				await asyncio.gather(*(
+					run_virtual_user(client, user, per_user, args.mix, args.seed * 1_000_003 + index, results)
+					for index, user in enumerate(virtual_users)
+				))
+				elapsed = time.perf_counter() - started
+
+	report = {
+		"meta": {
+			**run_metadata(database_url, not args.real_redis),
+			"users": args.users,
+			"posts_per_user": args.posts_per_user,
+			"requests": per_user * args.concurrency,
+			"concurrency": args.concurrency,
+			"mix": args.mix,
+			"seed": args.seed,
+		},
+		"total": summarize(
+			[latency for operation in results.values() for latency in operation.latencies_ms],
+			sum(operation.errors for operation in results.values()),
+			elapsed,
+		),
+		"operations": {
+			name: summarize(operation.latencies_ms, operation.errors, elapsed)
+			for name, operation in sorted(results.items())
+		},
+	}
+
+	output = json.dumps(report, indent=2)
+	print(output)
+	if args.output:
+		with open(args.output, "w") as file:
+			file.write(output + "\n")
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
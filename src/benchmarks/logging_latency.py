@@ -0,0 +1,99 @@
+"""
+Logging latency: simulated requests on the event loop that each log a burst of lines, with
+the root logger writing straight to a file (the old basicConfig setup, one write + flush per
+record on the loop thread) and through utils.log's queue pipeline in text and JSON format.
+Request latency percentiles show what the logging costs every request on the worker.
+The gap depends on the disk: on tmpfs the file writes are nearly free, so point --log-dir
+at the volume the app logs to in production.
+
+    cd src && python -m benchmarks.logging_latency --requests 5000 --lines 20 --log-dir /var/log/app
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.harness import percentile
+from config import LoggingParams
+from utils.log import TEXT_FORMAT, configure_logging, shutdown_logging, request_id_var
+
+
+log = logging.getLogger("benchmark")
+
+
+async def handle_request(index: int, lines: int, latencies: list[float]) -> None:
+	started = time.perf_counter()
+	request_id_var.set(f"req-{index}")
+	for line in range(lines):
+		log.info("request %d step %d user=%d payload=%s", index, line, index % 100, "x" * 80)
+		if line % 5 == 0:
+			await asyncio.sleep(0)
+	latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def drive(requests: int, lines: int, concurrency: int) -> dict[str, float]:
+	latencies: list[float] = []
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def one(index: int) -> None:
+		async with semaphore:
+			await handle_request(index, lines, latencies)
+
+	started = time.perf_counter()
+	await asyncio.gather(*(one(index) for index in range(requests)))
+	elapsed = time.perf_counter() - started
+
+	return {
+		"requests_per_s": round(requests / elapsed, 1),
+		"latency_p50_ms": percentile(latencies, 0.5),
+		"latency_p99_ms": percentile(latencies, 0.99),
+		"latency_max_ms": round(max(latencies), 3),
+	}
+
+
+async def run_direct(path: str, args) -> dict[str, float]:
+	handler = logging.FileHandler(path, encoding="utf-8")
+	handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+	root = logging.getLogger()
+	root.setLevel(logging.INFO)
+	root.addHandler(handler)
+	try:
+		return await drive(args.requests, args.lines, args.concurrency)
+	finally:
+		root.removeHandler(handler)
+		handler.close()
+
+
+async def run_queue(path: str, log_format: str, args) -> dict[str, float]:
+	configure_logging(LoggingParams(LOG_FILE=path, LOG_FORMAT=log_format, LOG_BATCH_SIZE=args.batch_size))
+	try:
+		return await drive(args.requests, args.lines, args.concurrency)
+	finally:
+		shutdown_logging()
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--requests', type=int, default=5000)
+	parser.add_argument('--lines', type=int, default=20, help='log records per request')
+	parser.add_argument('--concurrency', type=int, default=50)
+	parser.add_argument('--batch-size', type=int, default=100)
+	parser.add_argument('--log-dir', default=None, help='where to write the log files, a temporary directory by default')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory(dir=args.log_dir) as directory:
+		report = {
+			"requests": args.requests,
+			"lines_per_request": args.lines,
+			"direct_file": await run_direct(os.path.join(directory, "direct.log"), args),
+			"queue_text": await run_queue(os.path.join(directory, "queue.log"), "text", args),
+			"queue_json": await run_queue(os.path.join(directory, "queue.json.log"), "json", args),
+		}
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
@@ -0,0 +1,70 @@
+"""
+Login storm: N concurrent password verifications against bcrypt hashes, once inline on
+the event loop (what a naive bcrypt switch would do) and once through services.authentication's
+executor. A probe coroutine sleeps in short ticks the whole time; how late it wakes up is the
+event loop lag every other request on the worker would see.
+
+    cd src && python -m benchmarks.login_storm --logins 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.harness import percentile
+from services.authentication import pwd_context, verify_password
+
+
+async def probe_lag(stop: asyncio.Event, tick: float, lags: list[float]) -> None:
+	while not stop.is_set():
+		started = time.perf_counter()
+		await asyncio.sleep(tick)
+		lags.append((time.perf_counter() - started - tick) * 1000)
+
+
+async def verify_inline(password: str, password_hash: str) -> tuple[bool, str | None]:
+	return pwd_context.verify_and_update(password, password_hash)
+
+
+async def storm(verify, logins: int, password_hash: str, tick: float) -> dict[str, float]:
+	stop = asyncio.Event()
+	lags: list[float] = []
+	probe = asyncio.create_task(probe_lag(stop, tick, lags))
+	await asyncio.sleep(tick * 2)
+
+	started = time.perf_counter()
+	results = await asyncio.gather(*(verify("correct horse", password_hash) for _ in range(logins)))
+	elapsed = time.perf_counter() - started
+
+	stop.set()
+	await probe
+	assert all(valid for valid, _ in results)
+
+	return {
+		"logins_per_s": round(logins / elapsed, 1),
+		"elapsed_s": round(elapsed, 3),
+		"loop_lag_p50_ms": percentile(lags, 0.5),
+		"loop_lag_p99_ms": percentile(lags, 0.99),
+		"loop_lag_max_ms": round(max(lags), 3) if lags else 0.0,
+	}
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--logins', type=int, default=200)
+	parser.add_argument('--tick-ms', type=float, default=5.0)
+	args = parser.parse_args()
+
+	password_hash = pwd_context.hash("correct horse")
+	tick = args.tick_ms / 1000
+
+	report = {
+		"logins": args.logins,
+		"inline": await storm(verify_inline, args.logins, password_hash, tick),
+		"executor": await storm(verify_password, args.logins, password_hash, tick),
+	}
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
@@ -0,0 +1,235 @@
+"""
+Replay: streams a recorded traffic file against an in-process instance of the app (same setup as
+load_test), keeping the recorded gaps between requests divided by --speed, with at most
+--concurrency requests in flight. Reports latency percentiles, error rate and status codes per
+endpoint, plus how late requests started against their schedule (it grows once the app, or the
+concurrency cap, can't keep up with the recorded rate).
+
+One JSON object per line; lines without "ts", "method" and "path" are counted as skipped:
+
+    {"ts": 12.5, "method": "POST", "path": "/post/add", "user": "alice", "json": {"text": "hi"}}
+
+    ts       seconds, any origin (epoch or relative); only the differences matter
+    user     optional; signed up (or logged in) before the replay starts and sent as a Bearer token
+    json     optional request body; the string "$post_id" anywhere in it is replaced with the most
+             recent post this user created during the replay, so recorded deletes hit real rows
+    headers  optional extra request headers
+
+    cd src && python -m benchmarks.replay benchmarks/traffic.sample.jsonl --speed 10 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any
+
+from benchmarks.harness import prepare_environment, running_app, run_metadata, summarize, percentile
+
+
+PASSWORD = "replay-password"
+POST_ID = "$post_id"
+
+
+@dataclass
+class Principal:
+	login: str
+	token: str = ""
+	post_ids: list[int] = field(default_factory=list)
+	lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class EndpointResults:
+	latencies_ms: list[float] = field(default_factory=list)
+	errors: int = 0
+	statuses: Counter = field(default_factory=Counter)
+
+
+def parse_record(line: str) -> dict[str, Any] | None:
+	try:
+		record = json.loads(line)
+	except ValueError:
+		return None
+	if not isinstance(record, dict) or not {"ts", "method", "path"} <= record.keys():
+		return None
+	return record
+
+
+def substitute_post_id(value: Any, principal: Principal | None) -> Any:
+	if value == POST_ID:
+		return principal.post_ids.pop() if principal and principal.post_ids else None
+	if isinstance(value, dict):
+		return {key: substitute_post_id(item, principal) for key, item in value.items()}
+	if isinstance(value, list):
+		return [substitute_post_id(item, principal) for item in value]
+	return value
+
+
+async def ensure_token(client, principal: Principal) -> None:
+	async with principal.lock:
+		if principal.token:
+			return
+		credentials = {"login": principal.login, "password": PASSWORD}
+		response = await client.post("/user/sign-up", json=credentials)
+		if response.status_code == 409:
+			response = await client.post("/user/login", json=credentials)
+		response.raise_for_status()
+		principal.token = response.json()["data"]
+
+
+class Replayer:
+	def __init__(self, client, concurrency: int):
+		self.client = client
+		self.semaphore = asyncio.Semaphore(concurrency)
+		self.principals: dict[str, Principal] = {}
+		self.endpoints: dict[str, EndpointResults] = {}
+		self.schedule_lag_ms: list[float] = []
+		self.skipped = 0
+
+	def principal(self, user: str) -> Principal:
+		return self.principals.setdefault(user, Principal(login=f"replay-{user}"))
+
+	async def sign_in(self, path: str) -> None:
+		"""
+		Signs up (or logs in) every user in the file up front, so their bcrypt hashing is not part of the
+		timed replay and recorded requests that need the account, like a login, find it.
+		"""
+		with open(path) as file:
+			users = {record["user"] for record in map(parse_record, file) if record and record.get("user")}
+		# A failure is retried, and counted, by the first request of that user
+		await asyncio.gather(
+			*(ensure_token(self.client, self.principal(user)) for user in users),
+			return_exceptions=True,
+		)
+
+	async def send(self, record: dict[str, Any]) -> None:
+		method, path = record["method"].upper(), record["path"]
+		endpoint = self.endpoints.setdefault(f"{method} {path.split('?', 1)[0]}", EndpointResults())
+		principal = None
+		headers = dict(record.get("headers") or {})
+		started = time.perf_counter()
+
+		try:
+			if record.get("user"):
+				principal = self.principal(record["user"])
+				# Only does work here if signing this user in before the replay failed
+				await ensure_token(self.client, principal)
+				headers["Authorization"] = f"Bearer {principal.token}"
+			body = substitute_post_id(record.get("json"), principal)
+
+			started = time.perf_counter()
+			response = await self.client.request(method, path, json=body, headers=headers)
+			latency_ms = (time.perf_counter() - started) * 1000
+		except Exception as error:
+			# An unhandled exception in the app or a failed sign-up; count it and keep replaying
+			endpoint.latencies_ms.append((time.perf_counter() - started) * 1000)
+			endpoint.errors += 1
+			endpoint.statuses[type(error).__name__] += 1
+			return
+
+		endpoint.latencies_ms.append(latency_ms)
+		endpoint.statuses[str(response.status_code)] += 1
+		if response.status_code >= 400:
+			endpoint.errors += 1
+		elif principal and method == "POST" and path.startswith("/post/add"):
+			principal.post_ids.append(response.json()["data"])
+
+	async def replay(self, path: str, speed: float, limit: int | None) -> float:
+		in_flight: set[asyncio.Task] = set()
+		started = time.perf_counter()
+		first_ts = None
+		sent = 0
+
+		with open(path) as file:
+			for line in file:
+				record = parse_record(line)
+				if record is None:
+					self.skipped += 1
+					continue
+				if limit is not None and sent >= limit:
+					break
+
+				first_ts = record["ts"] if first_ts is None else first_ts
+				due = started + (record["ts"] - first_ts) / speed
+				delay = due - time.perf_counter()
+				if delay > 0:
+					await asyncio.sleep(delay)
+
+				# Reading stops while the cap is reached, which shows up as schedule lag
+				await self.semaphore.acquire()
+				self.schedule_lag_ms.append(max(0.0, time.perf_counter() - due) * 1000)
+				task = asyncio.create_task(self.send(record))
+				in_flight.add(task)
+				task.add_done_callback(self._finished(in_flight))
+				sent += 1
+
+		await asyncio.gather(*in_flight)
+		return time.perf_counter() - started
+
+	def _finished(self, in_flight: set[asyncio.Task]):
+		def callback(task: asyncio.Task) -> None:
+			in_flight.discard(task)
+			self.semaphore.release()
+		return callback
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('traffic', help='JSONL traffic file')
+	parser.add_argument('--speed', type=float, default=1.0, help='2 replays twice as fast as recorded')
+	parser.add_argument('--concurrency', type=int, default=50, help='max requests in flight')
+	parser.add_argument('--limit', type=int, default=None, help='stop after this many requests')
+	parser.add_argument('--database-url', default=None, help='async SQLAlchemy URL; a temporary SQLite file by default')
+	parser.add_argument('--real-redis', action='store_true', help='use REDIS_HOST/REDIS_PORT instead of fakeredis')
+	parser.add_argument('--reset', action='store_true', help='drop the tables first')
+	parser.add_argument('--output', default=None, help='also write the JSON report to this file')
+	args = parser.parse_args()
+
+	import httpx
+
+	with tempfile.TemporaryDirectory() as workdir:
+		database_url = prepare_environment(args.database_url, workdir)
+
+		async with running_app(fake_redis=not args.real_redis, reset=args.reset) as app:
+			async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay") as client:
+				replayer = Replayer(client, args.concurrency)
+				await replayer.sign_in(args.traffic)
+				elapsed = await replayer.replay(args.traffic, args.speed, args.limit)
+
+	endpoints = replayer.endpoints
+	report = {
+		"meta": {
+			**run_metadata(database_url, not args.real_redis),
+			"traffic": args.traffic,
+			"speed": args.speed,
+			"concurrency": args.concurrency,
+			"skipped_lines": replayer.skipped,
+		},
+		"total": summarize(
+			[latency for endpoint in endpoints.values() for latency in endpoint.latencies_ms],
+			sum(endpoint.errors for endpoint in endpoints.values()),
+			elapsed,
+		),
+		"schedule_lag_p50_ms": percentile(replayer.schedule_lag_ms, 0.5),
+		"schedule_lag_p99_ms": percentile(replayer.schedule_lag_ms, 0.99),
+		"endpoints": {
+			name: {
+				**summarize(endpoint.latencies_ms, endpoint.errors, elapsed),
+				"statuses": dict(sorted(endpoint.statuses.items())),
+			}
+			for name, endpoint in sorted(endpoints.items())
+		},
+	}
+
+	output = json.dumps(report, indent=2)
+	print(output)
+	if args.output:
+		with open(args.output, "w") as file:
+			file.write(output + "\n")
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
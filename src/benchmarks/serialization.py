@@ -0,0 +1,75 @@
+"""
+Encode/decode throughput and peak allocations of the JSON serializers in utils.serialization
+(plus pydantic-core, which serialises cached /post/all pages) for PostSchema lists.
+
+    cd src && python -m benchmarks.serialization --sizes 10 1000 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from pydantic import TypeAdapter
+
+from schemas import PostSchema
+from utils.serialization import SERIALIZERS
+
+
+def make_posts(size: int) -> list[PostSchema]:
+	return [PostSchema(id=i, text=f"post {i} " + "lorem ipsum dolor sit amet " * 4) for i in range(size)]
+
+
+def timed(func, repeat: int) -> float:
+	started = time.perf_counter()
+	for _ in range(repeat):
+		func()
+	return (time.perf_counter() - started) / repeat
+
+
+def peak_allocated(func) -> int:
+	tracemalloc.start()
+	func()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return peak
+
+
+def run(size: int) -> dict:
+	posts = make_posts(size)
+	repeat = max(1, 100_000 // size)
+	report = {}
+
+	adapter = TypeAdapter(list[PostSchema])
+	candidates = {
+		name: (lambda s=serializer: s.dumps(posts), serializer.loads)
+		for name, serializer in SERIALIZERS.items()
+	}
+	candidates['pydantic_core'] = (lambda: adapter.dump_json(posts), adapter.validate_json)
+
+	for name, (encode, decode) in candidates.items():
+		payload = encode()
+		encode_s = timed(encode, repeat)
+		decode_s = timed(lambda: decode(payload), repeat)
+		report[name] = {
+			"payload_bytes": len(payload),
+			"encode_ms": round(encode_s * 1000, 3),
+			"decode_ms": round(decode_s * 1000, 3),
+			"encode_mb_s": round(len(payload) / encode_s / 1e6, 1),
+			"decode_mb_s": round(len(payload) / decode_s / 1e6, 1),
+			"encode_peak_alloc_bytes": peak_allocated(encode),
+			"decode_peak_alloc_bytes": peak_allocated(lambda: decode(payload)),
+		}
+
+	return report
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1_000, 100_000])
+	args = parser.parse_args()
+
+	print(json.dumps({str(size): run(size) for size in args.sizes}, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,98 @@
+"""
+Per-call cost of building the filtered SELECTs in BaseRepository: the previous approach
+(a fresh select() per call) against the memoised statement templates. Each call is timed
+through statement construction plus cache-key generation, which is what SQLAlchemy does on
+every execute before it can look up its compiled cache; a cold compile is shown for scale.
+No database is needed: the repository runs against a session that only records the statement.
+
+    cd src && python -m benchmarks.statement_cache --calls 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy import and_, asc, desc, select
+from sqlalchemy.dialects import postgresql
+
+from models.user import User  # noqa: F401 - Post.user needs the User mapper registered
+from models.post import Post
+from repositories import PostRepository
+
+
+class _Result:
+	def scalars(self):
+		return self
+
+	def all(self):
+		return []
+
+	def scalar_one_or_none(self):
+		return None
+
+
+class RecordingSession:
+	def __init__(self):
+		self.stmt = None
+
+	async def execute(self, stmt, params=None):
+		self.stmt = stmt
+		return _Result()
+
+
+def rebuild_find_all_by(model, filters: dict, order_by: dict, limit: int):
+	stmt = select(model)
+	conditions = []
+	for field, value in filters.items():
+		column = getattr(model, field, None)
+		if column:
+			conditions.append(column == value)
+	stmt = stmt.where(and_(*conditions))
+	stmt = stmt.order_by(*(
+		desc(getattr(model, field)) if direction == 'desc' else asc(getattr(model, field))
+		for field, direction in order_by.items()
+	))
+	return stmt.limit(limit)
+
+
+def per_call_us(started: float, calls: int) -> float:
+	return round((time.perf_counter() - started) / calls * 1_000_000, 2)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--calls', type=int, default=20_000)
+	args = parser.parse_args()
+
+	order_by = {"id": "desc"}
+	dialect = postgresql.dialect()
+
+	started = time.perf_counter()
+	for user_id in range(args.calls):
+		rebuild_find_all_by(Post, {"user_id": user_id}, order_by, 20)._generate_cache_key()
+	rebuilt = per_call_us(started, args.calls)
+
+	session = RecordingSession()
+	repo = PostRepository(session, Post)
+	started = time.perf_counter()
+	for user_id in range(args.calls):
+		await repo.find_all_by({"user_id": user_id}, order_by=order_by, limit=20)
+		session.stmt._generate_cache_key()
+	templated = per_call_us(started, args.calls)
+
+	started = time.perf_counter()
+	for user_id in range(200):
+		rebuild_find_all_by(Post, {"user_id": user_id}, order_by, 20).compile(dialect=dialect)
+	cold_compile = per_call_us(started, 200)
+
+	print(json.dumps({
+		"calls": args.calls,
+		"rebuild_per_call_us": rebuilt,
+		"template_per_call_us": templated,
+		"cold_compile_per_call_us": cold_compile,
+		"speedup": round(rebuilt / templated, 2) if templated else None,
+	}, indent=2))
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
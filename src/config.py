@@ -10,6 +10,10 @@ load_dotenv()
 
 
 MAX_POST_SIZE = 1_048_576
+MAX_POST_BATCH = 500
+
+POST_PAGE_DEFAULT_LIMIT = 20
+POST_PAGE_MAX_LIMIT = 100
 
 # Base
 DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -42,13 +46,23 @@ class EnvSettings(BaseSettings):
 class JwtOAuthConfig(EnvSettings):
     secret_key: str | None = os.environ.get("SECRET_KEY")
     algorithm: str = 'HS256'
-    access_token_expire_minutes = 30
+    access_token_expire_minutes: int = 30
 
+    token_cache_size: int = Field(10_000, alias='AUTH_TOKEN_CACHE_SIZE')
+    revocation_enabled: bool = Field(False, alias='AUTH_REVOCATION_ENABLED')
+    password_hash_workers: int = Field(4, alias='PASSWORD_HASH_WORKERS')
 
 
 class DBParams(EnvSettings):
     url: str = Field(..., alias='DATABASE_URL')
 
+    pool_size: int = Field(5, alias='DB_POOL_SIZE')
+    max_overflow: int = Field(10, alias='DB_MAX_OVERFLOW')
+    pool_recycle: int = Field(-1, alias='DB_POOL_RECYCLE')
+    pool_timeout: int = Field(30, alias='DB_POOL_TIMEOUT')
+    pool_pre_ping: bool = Field(True, alias='DB_POOL_PRE_PING')
+    echo: bool = Field(False, alias='DB_ECHO')
+
 
 class RedisParams(EnvSettings):
     host: str = Field(..., alias='REDIS_HOST')
@@ -57,15 +71,58 @@ class RedisParams(EnvSettings):
     ssl_cert: str = Field(..., alias='REDIS_SSL_CERT')
     use_ttl: str = Field(..., alias='REDIS_USE_TLS')
 
+    max_connections: int = Field(50, alias='REDIS_MAX_CONNECTIONS')
+    pool_timeout: float = Field(5.0, alias='REDIS_POOL_TIMEOUT')
+    health_check_interval: int = Field(30, alias='REDIS_HEALTH_CHECK_INTERVAL')
+    socket_timeout: float = Field(5.0, alias='REDIS_SOCKET_TIMEOUT')
+    socket_connect_timeout: float = Field(5.0, alias='REDIS_SOCKET_CONNECT_TIMEOUT')
+
+
+class CacheParams(EnvSettings):
+    post_list_ttl: int = Field(300, alias='POST_LIST_CACHE_TTL')
+    post_count_reconcile_interval: int = Field(600, alias='POST_COUNT_RECONCILE_INTERVAL')
+    xfetch_beta: float = Field(1.0, alias='CACHE_XFETCH_BETA')
+    distributed_lock: bool = Field(False, alias='CACHE_DISTRIBUTED_LOCK')
+    lock_timeout_ms: int = Field(5000, alias='CACHE_LOCK_TIMEOUT_MS')
+    # In-process L1 in front of Redis; keep its TTL well below the Redis ones
+    local_enabled: bool = Field(False, alias='CACHE_L1_ENABLED')
+    local_ttl: float = Field(2.0, alias='CACHE_L1_TTL')
+    local_max_bytes: int = Field(64 * 1024 * 1024, alias='CACHE_L1_MAX_BYTES')
+
+
+class PostWriteParams(EnvSettings):
+    # Write-behind: /post/add queues the post in a Redis stream and a background consumer inserts it
+    write_behind: bool = Field(False, alias='POST_WRITE_BEHIND')
+    id_block_size: int = Field(100, alias='POST_ID_BLOCK_SIZE')
+    batch_size: int = Field(500, alias='POST_WRITE_BATCH_SIZE')
+    block_ms: int = Field(1000, alias='POST_WRITE_BLOCK_MS')
+    claim_idle_ms: int = Field(30_000, alias='POST_WRITE_CLAIM_IDLE_MS')
+    max_retries: int = Field(5, alias='POST_WRITE_MAX_RETRIES')
+
+
+class LoggingParams(EnvSettings):
+    file: str = Field('app.log', alias='LOG_FILE')
+    level: str = Field('INFO', alias='LOG_LEVEL')
+    format: str = Field('text', alias='LOG_FORMAT')
+    rotate_when: str = Field('midnight', alias='LOG_ROTATE_WHEN')
+    backup_count: int = Field(14, alias='LOG_BACKUP_COUNT')
+    batch_size: int = Field(100, alias='LOG_BATCH_SIZE')
+    flush_interval: float = Field(1.0, alias='LOG_FLUSH_INTERVAL')
+    access_log: bool = Field(False, alias='LOG_ACCESS')
+
 
 class GeneralParams(EnvSettings):
     environment: str = Field(..., alias='ENVIRONMENT')
+    json_serializer: str = Field('auto', alias='JSON_SERIALIZER')
 
 
 class Config(EnvSettings):
     db: DBParams = DBParams()
     redis: RedisParams = RedisParams()
+    cache: CacheParams = CacheParams()
+    posts: PostWriteParams = PostWriteParams()
     general: GeneralParams = GeneralParams()
+    logging: LoggingParams = LoggingParams()
     jwt: JwtOAuthConfig = JwtOAuthConfig()
 
 
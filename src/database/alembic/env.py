@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import async_engine_from_config
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from config import get_config  # noqa: E402
+from database import Base  # noqa: E402
+from models.user import User  # noqa: E402,F401
+from models.post import Post  # noqa: E402,F401
+
+
+config = context.config
+config.set_main_option('sqlalchemy.url', get_config().db.url)
+
+if config.config_file_name is not None:
+	fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+	context.configure(
+		url=config.get_main_option('sqlalchemy.url'),
+		target_metadata=target_metadata,
+		literal_binds=True,
+		dialect_opts={"paramstyle": "named"},
+	)
+
+	with context.begin_transaction():
+		context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+	context.configure(connection=connection, target_metadata=target_metadata)
+
+	with context.begin_transaction():
+		context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+	connectable = async_engine_from_config(
+		config.get_section(config.config_ini_section, {}),
+		prefix='sqlalchemy.',
+		poolclass=pool.NullPool,
+	)
+
+	async with connectable.connect() as connection:
+		await connection.run_sync(do_run_migrations)
+
+	await connectable.dispose()
+
+
+def run_migrations_online() -> None:
+	asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+	run_migrations_offline()
+else:
+	run_migrations_online()
@@ -0,0 +1,49 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+Databases created before migrations existed already have these tables;
+mark them with `alembic stamp 0001` and then upgrade.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+	op.create_table(
+		'users',
+		sa.Column('id', sa.Integer(), nullable=False),
+		sa.Column('login', sa.String(length=255), nullable=False),
+		sa.Column('password', sa.String(length=255), nullable=False),
+		sa.PrimaryKeyConstraint('id'),
+	)
+	op.create_index('ix_users_id', 'users', ['id'], unique=False)
+
+	op.create_table(
+		'applications',
+		sa.Column('id', sa.Integer(), nullable=False),
+		sa.Column('user_id', sa.Integer(), nullable=False),
+		sa.Column('text', sa.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'), nullable=False),
+		sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+		sa.PrimaryKeyConstraint('id'),
+	)
+	op.create_index('ix_applications_id', 'applications', ['id'], unique=False)
+
+
+def downgrade() -> None:
+	op.drop_index('ix_applications_id', table_name='applications')
+	op.drop_table('applications')
+	op.drop_index('ix_users_id', table_name='users')
+	op.drop_table('users')
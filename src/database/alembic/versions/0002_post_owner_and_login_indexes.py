@@ -0,0 +1,30 @@
+"""post owner and login indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:05:00.000000
+
+(user_id, id) serves the per-user post listing and its keyset pagination
+without a table scan; the unique index on users.login backs every login
+and sign-up lookup. Duplicate logins must be cleaned up before upgrading.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+	op.create_index('ix_applications_user_id_id', 'applications', ['user_id', 'id'], unique=False)
+	op.create_index('ix_users_login', 'users', ['login'], unique=True)
+
+
+def downgrade() -> None:
+	op.drop_index('ix_users_login', table_name='users')
+	op.drop_index('ix_applications_user_id_id', table_name='applications')
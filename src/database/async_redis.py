@@ -1,39 +1,195 @@
-import json
+import asyncio
 import logging
+import secrets
 
 from typing import Any
+from dataclasses import dataclass, asdict
 from datetime import timedelta
 
-from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+from redis.client import NEVER_DECODE
+from redis.exceptions import ResponseError
+from redis.asyncio.connection import Connection, SSLConnection
 
-from pydantic.json import pydantic_encoder
+from config import get_config
 
-from config import REDIS_HOST, REDIS_PASSWORD, REDIS_PORT, ENVIRONMENT, get_config
+from utils.instrumentation import redis_call
+from utils.lru import TaggedTTLCache
+from utils.serialization import serializer
 
 
-def connection_pool_generator():
-	pool = ConnectionPool(
-		host=REDIS_HOST,
-		port=REDIS_PORT,
-		password=REDIS_PASSWORD if ENVIRONMENT == 'production' else None,
-		ssl=True if ENVIRONMENT == 'production' else False,
+class InstrumentedConnectionPool(BlockingConnectionPool):
+	"""Bounded pool that blocks callers when exhausted and counts how often that happens."""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.waits = 0
+
+	async def get_connection(self, command_name, *keys, **options):
+		if not self._available_connections and len(self._in_use_connections) >= self.max_connections:
+			self.waits += 1
+		return await super().get_connection(command_name, *keys, **options)
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"max_connections": self.max_connections,
+			"in_use": len(self._in_use_connections),
+			"idle": len(self._available_connections),
+			"waits": self.waits,
+		}
+
+
+class InstrumentedPipeline(Pipeline):
+	async def execute(self, raise_on_error: bool = True):
+		with redis_call():
+			return await super().execute(raise_on_error)
+
+
+class InstrumentedRedis(Redis):
+	"""Times every round trip for the current request; a pipeline counts once, when it is executed."""
+
+	async def execute_command(self, *args, **options):
+		with redis_call():
+			return await super().execute_command(*args, **options)
+
+	def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> InstrumentedPipeline:
+		return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+_pool: InstrumentedConnectionPool | None = None
+_local_cache: TaggedTTLCache | None = None
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# DEL only if the lock still holds our token, so an expired lock re-acquired by someone else is left alone
+RELEASE_LOCK = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+# INCRBY that leaves missing keys missing, so a counter nobody has seeded yet is not started from zero
+INCR_IF_EXISTS = "if redis.call('EXISTS', KEYS[1]) == 1 then return redis.call('INCRBY', KEYS[1], ARGV[1]) end"
+
+# Raises a counter to at least ARGV[1], never lowers it
+SET_IF_GREATER = "if tonumber(redis.call('GET', KEYS[1]) or '0') < tonumber(ARGV[1]) then redis.call('SET', KEYS[1], ARGV[1]) end"
+
+
+def connection_pool_generator() -> InstrumentedConnectionPool:
+	config = get_config()
+	production = config.general.environment == 'production'
+
+	return InstrumentedConnectionPool(
+		connection_class=SSLConnection if production else Connection,
+		host=config.redis.host,
+		port=config.redis.port,
+		password=config.redis.password if production else None,
+		max_connections=config.redis.max_connections,
+		timeout=config.redis.pool_timeout,
+		health_check_interval=config.redis.health_check_interval,
+		socket_timeout=config.redis.socket_timeout,
+		socket_connect_timeout=config.redis.socket_connect_timeout,
 		decode_responses=True,
+		encoding="utf-8",
 	)
-	while True:
-		yield pool
+
+
+def init_redis_pool(pool: InstrumentedConnectionPool | None = None) -> InstrumentedConnectionPool:
+	# `pool` lets the benchmarks install a pool of their own (e.g. fakeredis connections) before startup
+	global _pool
+	if _pool is None:
+		_pool = pool or connection_pool_generator()
+	return _pool
+
+
+def get_redis_pool() -> InstrumentedConnectionPool:
+	return init_redis_pool()
+
+
+async def close_redis_pool() -> None:
+	global _pool
+	if _pool is not None:
+		await _pool.disconnect()
+		_pool = None
+
+
+def redis_pool_stats() -> dict[str, int]:
+	if _pool is None:
+		return {}
+	return _pool.stats()
+
+
+def get_local_cache() -> TaggedTTLCache | None:
+	global _local_cache
+	config = get_config().cache
+	if _local_cache is None and config.local_enabled:
+		_local_cache = TaggedTTLCache(config.local_max_bytes, config.local_ttl)
+	return _local_cache
+
+
+def local_cache_stats() -> dict[str, int]:
+	if _local_cache is None:
+		return {}
+	return {"entries": len(_local_cache), "bytes": _local_cache.size, "max_bytes": _local_cache.max_bytes}
+
+
+async def listen_for_invalidations() -> None:
+	"""Drop L1 entries that any worker has invalidated; runs until cancelled."""
+	local = get_local_cache()
+	log = logging.getLogger("CacheInvalidation")
+
+	while local is not None:
+		pubsub = Redis(connection_pool=get_redis_pool()).pubsub()
+		try:
+			await pubsub.subscribe(INVALIDATION_CHANNEL)
+			# Whatever was published while we were not subscribed is lost, so start from empty
+			local.clear()
+			while True:
+				message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+				if message is not None:
+					local.invalidate(message["data"])
+		except asyncio.CancelledError:
+			raise
+		except Exception:
+			log.exception("Invalidation subscriber failed, resubscribing")
+			await asyncio.sleep(1)
+		finally:
+			await pubsub.aclose()
+
+
+@dataclass
+class CacheCounter:
+	hits: int = 0
+	misses: int = 0
+	coalesced: int = 0
+	early_refreshes: int = 0
+
+	def hit(self) -> None:
+		self.hits += 1
+
+	def miss(self) -> None:
+		self.misses += 1
+
+
+_cache_counters: dict[str, CacheCounter] = {}
+
+
+def cache_counter(name: str) -> CacheCounter:
+	if name not in _cache_counters:
+		_cache_counters[name] = CacheCounter()
+	return _cache_counters[name]
+
+
+def cache_stats() -> dict[str, dict[str, float]]:
+	stats = {}
+	for name, counter in _cache_counters.items():
+		lookups = counter.hits + counter.misses
+		stats[name] = {**asdict(counter), "hit_ratio": round(counter.hits / lookups, 4) if lookups else 0.0}
+	return stats
 
 
 class CacheDB:
-	def __init__(self):
+	def __init__(self, pool: BlockingConnectionPool | None = None):
 		self.config = get_config()
-		self.redis = Redis(
-			host=self.config.redis.host,
-			port=self.config.redis.port,
-			password=self.config.redis.password if self.config.general.environment == 'production' else None,
-			ssl=True if self.config.general.environment == 'production' else False,
-			decode_responses=True,
-			encoding="utf-8",
-		)
+		self.redis = InstrumentedRedis(connection_pool=pool or get_redis_pool())
+		self.local = get_local_cache()
 		self.log = logging.getLogger(self.__class__.__name__)
 
 	async def __aenter__(self):
@@ -42,8 +198,26 @@ class CacheDB:
 	async def __aexit__(self, exc_type, exc_val, exc_tb):
 		await self.redis.close()
 
-	def pipeline(self):
-		return self.redis.pipeline()
+	def pipeline(self, transaction: bool = True):
+		return self.redis.pipeline(transaction=transaction)
+
+	def local_get(self, tag: str, key: Any) -> Any:
+		return self.local.get(tag, key) if self.local is not None else None
+
+	def local_set(self, tag: str, key: Any, value: Any) -> None:
+		if self.local is not None:
+			self.local.set(tag, key, value)
+
+	def publish_invalidation(self, pipe, *tags: str) -> None:
+		# Every worker, this one included, evicts `tags` from its L1 once `pipe` is executed
+		if self.local is not None:
+			for tag in tags:
+				pipe.publish(INVALIDATION_CHANNEL, tag)
+
+	def evict_local(self, *tags: str) -> None:
+		if self.local is not None:
+			for tag in tags:
+				self.local.invalidate(tag)
 
 	async def incr(self, name: Any, amount: int = 1):
 		return await self.redis.incr(name=name, amount=amount)
@@ -57,21 +231,121 @@ class CacheDB:
 	async def get(self, name: Any) -> Any:
 		return await self.redis.get(name=name)
 
+	async def get_or_init(self, name: Any, initial: Any, expire_time: int | timedelta | None = None) -> Any:
+		async with self.redis.pipeline(transaction=False) as pipe:
+			pipe.set(name=name, value=initial, ex=expire_time, nx=True)
+			pipe.get(name=name)
+			_, value = await pipe.execute()
+		return value
+
+	async def incr_if_exists(self, name: Any, amount: int = 1) -> int | None:
+		return await self.redis.eval(INCR_IF_EXISTS, 1, name, amount)
+
+	async def set_if_greater(self, name: Any, value: int) -> None:
+		await self.redis.eval(SET_IF_GREATER, 1, name, value)
+
+	async def run_script(self, script: str, keys: list, args: list) -> Any:
+		return await self.redis.eval(script, len(keys), *keys, *args)
+
+	async def exists(self, name: Any) -> bool:
+		return bool(await self.redis.exists(name))
+
 	async def delete(self, names: Any) -> Any:
 		return await self.redis.delete(names)
 
+	async def hget(self, name: Any, key: Any) -> Any:
+		return await self.redis.hget(name=name, key=key)
+
+	async def hmget_raw(self, name: Any, *keys: Any) -> list[bytes | None]:
+		# Undecoded bytes, for values that go to the client as they are
+		return await self.redis.execute_command('HMGET', name, *keys, **{NEVER_DECODE: True})
+
+	async def hmget_raw_with_pttl(self, name: Any, *keys: Any) -> tuple[list[bytes | None], int]:
+		async with self.redis.pipeline(transaction=False) as pipe:
+			pipe.execute_command('HMGET', name, *keys, **{NEVER_DECODE: True})
+			pipe.pttl(name)
+			values, pttl = await pipe.execute()
+		return values, pttl
+
+	async def hgetall(self, name: Any) -> dict:
+		return await self.redis.hgetall(name)
+
+	async def hlen(self, name: Any) -> int:
+		return await self.redis.hlen(name)
+
+	async def smismember(self, name: Any, values: list) -> list[bool]:
+		return [bool(flag) for flag in await self.redis.smismember(name, values)]
+
+	async def xadd(self, stream: str, fields: dict) -> str:
+		return await self.redis.xadd(stream, fields)
+
+	async def newest_entry(self, stream: str) -> dict | None:
+		newest = await self.redis.xrevrange(stream, count=1)
+		return newest[0][1] if newest else None
+
+	async def ensure_group(self, stream: str, group: str) -> None:
+		# From the start of the stream, so entries added before the group existed are consumed too
+		try:
+			await self.redis.xgroup_create(stream, group, id="0", mkstream=True)
+		except ResponseError as error:
+			if "BUSYGROUP" not in str(error):
+				raise
+
+	async def read_group(self, stream: str, group: str, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict]]:
+		response = await self.redis.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block_ms)
+		return response[0][1] if response else []
+
+	async def claim_stale(self, stream: str, group: str, consumer: str, min_idle_ms: int, count: int) -> list[tuple[str, dict]]:
+		"""Entries delivered to some consumer more than `min_idle_ms` ago and never acknowledged."""
+		response = await self.redis.xautoclaim(stream, group, consumer, min_idle_ms, start_id="0-0", count=count)
+		return response[1]
+
+	async def stream_backlog(self, stream: str) -> tuple[int, str | None]:
+		"""Length of the stream and the id of its oldest entry."""
+		async with self.redis.pipeline(transaction=False) as pipe:
+			pipe.xlen(stream)
+			pipe.xrange(stream, count=1)
+			length, oldest = await pipe.execute()
+		return length, oldest[0][0] if oldest else None
+
+	async def acquire_lock(self, name: Any, timeout_ms: int) -> str | None:
+		token = secrets.token_hex(8)
+		if await self.redis.set(name=name, value=token, px=timeout_ms, nx=True):
+			return token
+		return None
+
+	async def release_lock(self, name: Any, token: str) -> None:
+		await self.redis.eval(RELEASE_LOCK, 1, name, token)
+
+	async def hset(
+		self,
+		name: Any,
+		key: Any = None,
+		value: Any = None,
+		mapping: dict | None = None,
+		expire_time: int | timedelta | None = None,
+	):
+		async with self.redis.pipeline(transaction=True) as pipe:
+			pipe.hset(name=name, key=key, value=value, mapping=mapping)
+			if expire_time is not None:
+				pipe.expire(name=name, time=expire_time)
+			await pipe.execute()
+
 	async def set_cache(
 		self,
 		data: dict,
 		key: str,
 		expiration: int | None = 3600,
 	):
-		data_str = json.dumps(data, default=pydantic_encoder)
-		await self.redis.set(key, data_str, expiration)
+		await self.redis.set(key, serializer.dumps(data), expiration)
 
 	async def persist(self, k: str, value: Any, to_json: bool = True, expire_time: int | timedelta | None = None):
 		if to_json:
-			val = json.dumps(value, default=pydantic_encoder)
+			val = serializer.dumps(value)
 		else:
 			val = value
 		await self.set(name=k, value=val, expire_time=expire_time)
+
+	async def load(self, k: str) -> Any:
+		value = await self.get(k)
+		return serializer.loads(value) if value is not None else None
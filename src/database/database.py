@@ -1,40 +1,27 @@
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-from config import DATABASE_URL
 import dataclasses
 import logging
+import time
 
 
 from functools import partial
 from config import Config, get_config
 
+from utils.instrumentation import record_sql, span
+
 
 class Base(DeclarativeBase):
 	pass
 
 
-async_engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-
-async_session = sessionmaker(
-	bind=async_engine,
-	class_=AsyncSession,
-	expire_on_commit=False
-)
-
-
-async def get_db():
-	async with async_session() as session:
-		try:
-			yield session
-		finally:
-			await session.close()
-
-
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class DBSettings:
 	database_url: str
 
@@ -46,20 +33,107 @@ class DBSettings:
 	sql_engine_echo: bool = False
 	application_name: str = 'Backend Application'
 
-	def __hash__(self):
-		return hash(self.database_url + str(self.sql_engine_echo))
+	@classmethod
+	def from_config(cls, config: Config) -> 'DBSettings':
+		return cls(
+			database_url=config.db.url,
+			db_engine_pool_pre_ping=config.db.pool_pre_ping,
+			db_engine_pool_recycle=config.db.pool_recycle,
+			db_engine_pool_size=config.db.pool_size,
+			db_engine_max_overflow=config.db.max_overflow,
+			db_engine_pool_timeout=config.db.pool_timeout,
+			sql_engine_echo=config.db.echo,
+		)
+
+
+class PoolMetricsMixin:
+	"""Times every checkout, including the wait for a free connection when the pool is exhausted."""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.checkouts = 0
+		self.checkout_timeouts = 0
+		self.checkout_wait_total = 0.0
+		self.checkout_wait_max = 0.0
+
+	def _do_get(self):
+		started = time.perf_counter()
+		try:
+			with span("db_checkout"):
+				return super()._do_get()
+		except PoolTimeoutError:
+			self.checkout_timeouts += 1
+			raise
+		finally:
+			waited = time.perf_counter() - started
+			self.checkouts += 1
+			self.checkout_wait_total += waited
+			self.checkout_wait_max = max(self.checkout_wait_max, waited)
+
+	def stats(self) -> dict[str, float]:
+		capacity = self.size() + self._max_overflow
+		return {
+			"pool_size": self.size(),
+			"max_overflow": self._max_overflow,
+			"checked_out": self.checkedout(),
+			"checked_in": self.checkedin(),
+			"overflow": self.overflow(),
+			"saturation": round(self.checkedout() / capacity, 3) if capacity > 0 else 0.0,
+			"checkouts": self.checkouts,
+			"checkout_timeouts": self.checkout_timeouts,
+			"checkout_wait_avg_ms": round(self.checkout_wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+			"checkout_wait_max_ms": round(self.checkout_wait_max * 1000, 3),
+		}
+
+
+class InstrumentedQueuePool(PoolMetricsMixin, QueuePool):
+	pass
+
+
+class InstrumentedAsyncQueuePool(PoolMetricsMixin, AsyncAdaptedQueuePool):
+	pass
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	record_sql(time.perf_counter() - conn.info["query_started"].pop())
+
+
+def _handle_error(exception_context):
+	# after_cursor_execute is skipped for a failed statement; still count it and keep the stack balanced
+	started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+	if started:
+		record_sql(time.perf_counter() - started.pop())
+
+
+def instrument_engine(engine: Engine) -> None:
+	"""Counts and times every statement for the request it runs in (see utils.instrumentation)."""
+	event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+	event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+	event.listen(engine, "handle_error", _handle_error)
+
+
+# Read-only lookups: none of them forces the database to assign an id to a transaction that has not written yet
+TRANSACTION_ID_QUERIES = {
+	'postgresql': 'SELECT txid_current_if_assigned()',
+	'mysql': 'SELECT trx_id FROM information_schema.innodb_trx WHERE trx_mysql_thread_id = CONNECTION_ID()',
+}
 
 
 class SQLAlchemyManager:
 	logger = logging.getLogger("sqlalchemy")
-	_engines = {}
+	_engines: dict[DBSettings, Engine] = {}
+	_async_engines: dict[DBSettings, AsyncEngine] = {}
 
 	@classmethod
 	def get_engine(cls, settings: DBSettings) -> Engine:
 		if settings in cls._engines:
 			return cls._engines[settings]
 
-		cls.logger.info("Create sync engine", extra=dataclasses.asdict(settings))
+		cls.logger.info("Create sync engine", extra=cls._log_extra(settings))
 
 		engine = create_engine(
 			settings.database_url.replace("+asyncpg", ""),
@@ -69,18 +143,20 @@ class SQLAlchemyManager:
 			pool_recycle=settings.db_engine_pool_recycle,
 			pool_size=settings.db_engine_pool_size,
 			pool_timeout=settings.db_engine_pool_timeout,
+			poolclass=InstrumentedQueuePool,
 			echo=settings.sql_engine_echo,
 		)
+		instrument_engine(engine)
 
 		cls._engines[settings] = engine
 		return engine
 
 	@classmethod
 	def get_async_engine(cls, settings: DBSettings) -> AsyncEngine:
-		if settings in cls._engines:
-			return cls._engines[settings]
+		if settings in cls._async_engines:
+			return cls._async_engines[settings]
 
-		cls.logger.info("Create async engine", extra=dataclasses.asdict(settings))
+		cls.logger.info("Create async engine", extra=cls._log_extra(settings))
 
 		engine = create_async_engine(
 			settings.database_url,
@@ -89,12 +165,38 @@ class SQLAlchemyManager:
 			pool_recycle=settings.db_engine_pool_recycle,
 			pool_size=settings.db_engine_pool_size,
 			pool_timeout=settings.db_engine_pool_timeout,
+			poolclass=InstrumentedAsyncQueuePool,
 			echo=settings.sql_engine_echo,
 		)
+		instrument_engine(engine.sync_engine)
 
-		cls._engines[settings] = engine
+		cls._async_engines[settings] = engine
 		return engine
 
+	@classmethod
+	def _log_extra(cls, settings: DBSettings) -> dict:
+		extra = dataclasses.asdict(settings)
+		extra.pop('database_url')
+		return extra
+
+	@classmethod
+	def pool_stats(cls) -> dict[str, dict[str, float]]:
+		engines = [*cls._engines.values(), *(engine.sync_engine for engine in cls._async_engines.values())]
+		return {
+			f"{engine.name}:{engine.url.database}": engine.pool.stats()
+			for engine in engines
+			if isinstance(engine.pool, PoolMetricsMixin)
+		}
+
+	@classmethod
+	async def dispose_all(cls) -> None:
+		for engine in cls._async_engines.values():
+			await engine.dispose()
+		for engine in cls._engines.values():
+			engine.dispose()
+		cls._async_engines.clear()
+		cls._engines.clear()
+
 	@classmethod
 	def get_async_session(cls, db_settings: DBSettings) -> AsyncSession:
 		return AsyncSession(
@@ -113,19 +215,41 @@ class SQLAlchemyManager:
 			expire_on_commit=False,
 		)
 
+	@classmethod
+	async def get_transaction_id(cls, session: AsyncSession):
+		if not cls.logger.isEnabledFor(logging.DEBUG) or not session.in_transaction():
+			return None
+
+		query = TRANSACTION_ID_QUERIES.get(session.bind.dialect.name)
+		if query is None:
+			return None
+
+		# Diagnostics must never abort the commit they describe: e.g. innodb_trx needs the PROCESS privilege.
+		# The savepoint keeps a failed lookup from poisoning the PostgreSQL transaction.
+		await session.flush()
+		try:
+			async with session.begin_nested():
+				return await session.scalar(text(query))
+		except Exception:
+			cls.logger.debug("Transaction id lookup failed", exc_info=True)
+			return None
+
 	@classmethod
 	def get_async_session_generator(cls, db_settings: DBSettings):
 		async def _get_session():
+			# The session begins on its first statement, so requests that never touch
+			# the database (e.g. cache hits) never check out a pooled connection.
 			async with cls.get_async_session(db_settings) as session:
-				xid = await session.scalar(func.txid_current())
 				try:
-					cls.logger.debug("Transaction BEGIN;", extra={"xid": xid})
 					yield session
-					await session.commit()
-					cls.logger.debug("Transaction COMMIT;", extra={"xid": xid})
+					if session.in_transaction():
+						xid = await cls.get_transaction_id(session)
+						await session.commit()
+						cls.logger.debug("Transaction COMMIT;", extra={"xid": xid})
 				except Exception:
+					# no id lookup here: an aborted PostgreSQL transaction rejects every statement but ROLLBACK
 					await session.rollback()
-					cls.logger.debug("Transaction ROLLBACK;", extra={"xid": xid})
+					cls.logger.debug("Transaction ROLLBACK;")
 					raise
 
 		return _get_session
@@ -135,7 +259,11 @@ def AsyncSessionMaker(db_settings: DBSettings):  # noqa: N802
 	return SQLAlchemyManager.get_async_session_generator(db_settings)
 
 
-db = DBSettings(database_url=get_config().db.url)
+db = DBSettings.from_config(get_config())
 get_session = AsyncSessionMaker(db)  # use as Depends(get_session)
-# engine = SQLAlchemyManager.get_async_engine(db)
-# sessionmaker = partial(SQLAlchemyManager.get_async_session, db)  # use as async with sessionmaker() as session:
+sessionmaker = partial(SQLAlchemyManager.get_async_session, db)  # use as async with sessionmaker() as session:
+
+
+async def get_db():
+	async with sessionmaker() as session:
+		yield session
@@ -1,7 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.async_redis import CacheDB
-from database.database import get_session
+from database.database import get_session, db, SQLAlchemyManager
 from fastapi import Depends
 
 from repositories import UserRepository, PostRepository
@@ -23,3 +23,12 @@ def get_post_service(session: AsyncSession = Depends(get_session)) -> PostServic
 		post_repo=PostRepository(session, Post),
 		redis=CacheDB()
 	)
+
+
+def get_post_export_service() -> PostService:
+	# The export body is streamed after the request's dependencies have exited,
+	# so it gets its own session which export_posts closes when the stream ends.
+	return PostService(
+		post_repo=PostRepository(SQLAlchemyManager.get_async_session(db), Post),
+		redis=CacheDB()
+	)
@@ -1,17 +1,25 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from typing import TYPE_CHECKING
+
+from sqlalchemy import Column, Integer, ForeignKey, Index, Text
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database import Base
 
-from .user import User
+if TYPE_CHECKING:
+	from .user import User
 
 
 class Post(Base):
 	__tablename__ = 'applications'
+	__table_args__ = (
+		Index('ix_applications_user_id_id', 'user_id', 'id'),
+	)
 
 	id = Column("id", Integer, primary_key=True, index=True)
 
-	user_id: Mapped[str] = mapped_column(ForeignKey("users.id"))
+	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
 
-	text: Mapped[str] = mapped_column()
+	# MAX_POST_SIZE characters do not fit into MySQL's 64 KiB TEXT
+	text: Mapped[str] = mapped_column(Text().with_variant(MEDIUMTEXT(), 'mysql'))
 
-	user: Mapped[User] = relationship('User', back_populates="posts")
+	user: Mapped["User"] = relationship('User', back_populates="posts")
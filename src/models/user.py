@@ -1,16 +1,22 @@
-from sqlalchemy import Column, Integer, String
+from typing import TYPE_CHECKING
+
+from sqlalchemy import Column, Integer, String, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database import Base
 
-from .post import Post
+if TYPE_CHECKING:
+	from .post import Post
 
 
 class User(Base):
 	__tablename__ = 'users'
+	__table_args__ = (
+		Index('ix_users_login', 'login', unique=True),
+	)
 
 	id = Column("id", Integer, primary_key=True, index=True)
 
-	login: Mapped[str] = mapped_column()
-	password_sha256: Mapped[str] = mapped_column('password')
+	login: Mapped[str] = mapped_column(String(255))
+	password_sha256: Mapped[str] = mapped_column('password', String(255))
 
-	posts: Mapped[list[Post]] = relationship('Post', back_populates="user", cascade="all, delete-orphan")
+	posts: Mapped[list["Post"]] = relationship('Post', back_populates="user", cascade="all, delete-orphan")
@@ -1,9 +1,13 @@
 from models.post import Post
 
 from utils.I_repository import BaseRepository
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class PostRepository(BaseRepository[Post]):
 	def __init__(self, db_session: AsyncSession, model: Post):
 		super().__init__(db_session, model)
+
+	async def max_id(self) -> int:
+		return await self.db_session.scalar(select(func.max(Post.id))) or 0
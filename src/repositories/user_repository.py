@@ -1,9 +1,17 @@
+from typing import Optional
+
 from models.user import User
 
 from utils.I_repository import BaseRepository
+from sqlalchemy import select, Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class UserRepository(BaseRepository[User]):
 	def __init__(self, db_session: AsyncSession, model: User):
 		super().__init__(db_session, model)
+
+	async def find_credentials(self, login: str) -> Optional[Row]:
+		stmt = select(User.id, User.login, User.password_sha256).where(User.login == login)
+		result = await self.db_session.execute(stmt)
+		return result.one_or_none()
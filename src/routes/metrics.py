@@ -0,0 +1,60 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from database.async_redis import redis_pool_stats, cache_stats, local_cache_stats
+from database.database import SQLAlchemyManager
+
+from schemas import ApiResult
+
+from services.post_writer import post_writer_stats
+
+from utils.instrumentation import render_histograms
+
+
+router = APIRouter()
+
+
+def render_gauges(metric: str, label: str, groups: dict[str, dict[str, float]]) -> list[str]:
+    lines = []
+    for name, stats in groups.items():
+        for key, value in stats.items():
+            lines.append(f'{metric}_{key}{{{label}="{name}"}} {value}')
+    return lines
+
+
+@router.get("", response_class=PlainTextResponse)
+async def get_prometheus_metrics() -> PlainTextResponse:
+    lines = [
+        *render_histograms(),
+        *render_gauges("redis_pool", "pool", {"default": redis_pool_stats()}),
+        *render_gauges("db_pool", "engine", SQLAlchemyManager.pool_stats()),
+        *render_gauges("app_cache", "cache", cache_stats()),
+        *render_gauges("local_cache", "cache", {"l1": local_cache_stats()}),
+        *render_gauges("post_write_behind", "stream", {"posts": await post_writer_stats()}),
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@router.get("/redis-pool")
+async def get_redis_pool_stats() -> ApiResult[dict[str, int]]:
+    return ApiResult(success=True, message="Redis pool stats", data=redis_pool_stats())
+
+
+@router.get("/db-pool")
+async def get_db_pool_stats() -> ApiResult[dict[str, dict[str, float]]]:
+    return ApiResult(success=True, message="DB pool stats", data=SQLAlchemyManager.pool_stats())
+
+
+@router.get("/cache")
+async def get_cache_stats() -> ApiResult[dict[str, dict[str, float]]]:
+    return ApiResult(success=True, message="Cache stats", data=cache_stats())
+
+
+@router.get("/local-cache")
+async def get_local_cache_stats() -> ApiResult[dict[str, int]]:
+    return ApiResult(success=True, message="L1 cache stats", data=local_cache_stats())
+
+
+@router.get("/write-behind")
+async def get_write_behind_stats() -> ApiResult[dict[str, float]]:
+    return ApiResult(success=True, message="Post write-behind stats", data=await post_writer_stats())
@@ -1,12 +1,24 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, Query, Response, status
+from fastapi.responses import StreamingResponse
 
-from dependencies import get_post_service
+from config import POST_PAGE_DEFAULT_LIMIT
 
-from schemas import AddPostSchema, DeletePostSchema, PostSchema
+from dependencies import get_post_service, get_post_export_service
+
+from schemas import (
+    AddPostSchema,
+    AddPostsBatchSchema,
+    DeletePostSchema,
+    DeletePostsBatchSchema,
+    DeletedPostSchema,
+    PostSchema,
+)
 
 from services import PostService, Authentication
 
+from utils.http import etag_matches
+
 from schemas import ApiResult
 
 
@@ -23,20 +35,67 @@ async def create_post(
     return ApiResult(success=True, message="Post was created", data=post_id)
 
 
-@router.get("/all")
+@router.post("/batch")
+async def create_posts(
+    current_user: Authentication,
+    data: AddPostsBatchSchema,
+    service: PostService = Depends(get_post_service)
+) -> ApiResult[List[int]]:
+    post_ids = await service.create_posts(data, current_user.id)
+    return ApiResult(success=True, message="Posts were created", data=post_ids)
+
+
+@router.get("/all", response_model=ApiResult[List[PostSchema]])
 async def get_all_posts(
     current_user: Authentication,
+    limit: int = Query(POST_PAGE_DEFAULT_LIMIT, ge=1),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     service: PostService = Depends(get_post_service)
-) -> ApiResult[List[PostSchema]]:
-    token = await service.get_all_posts(current_user.id)
-    return ApiResult(success=True, message="All posts was retreived", data=token)
+) -> Response:
+    etag = await service.get_posts_etag(current_user.id, limit, cursor)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    page = await service.get_all_posts(current_user.id, limit, cursor, etag)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+
+@router.get("/count")
+async def count_posts(
+    current_user: Authentication,
+    mode: Literal["fast", "exact"] = "fast",
+    service: PostService = Depends(get_post_service)
+) -> ApiResult[int]:
+    total = await service.count_posts(current_user.id, exact=mode == "exact")
+    return ApiResult(success=True, message="Posts were counted", data=total)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_posts(
+    current_user: Authentication,
+    service: PostService = Depends(get_post_export_service)
+) -> StreamingResponse:
+    return StreamingResponse(service.export_posts(current_user.id), media_type="application/x-ndjson")
 
 
 @router.delete("")
 async def delete_post(
-    _: Authentication,
+    current_user: Authentication,
     data: DeletePostSchema,
     service: PostService = Depends(get_post_service)
 ) -> ApiResult[bool]:
-    success = await service.delete_post(data.post_id)
+    success = await service.delete_post(data.post_id, current_user.id)
     return ApiResult(success=True, message="Post was deleted", data=success)
+
+
+@router.delete("/batch")
+async def delete_posts(
+    current_user: Authentication,
+    data: DeletePostsBatchSchema,
+    service: PostService = Depends(get_post_service)
+) -> ApiResult[List[DeletedPostSchema]]:
+    results = await service.delete_posts(data.post_ids, current_user.id)
+    return ApiResult(success=True, message="Posts were deleted", data=results)
@@ -4,7 +4,7 @@ from dependencies import get_user_service
 
 from schemas import LoginSchema, SignUpSchemas
 
-from services import UserService, Authentication
+from services import UserService, Authentication, oauth2_scheme, revoke_token
 
 from schemas import ApiResult
 
@@ -28,3 +28,12 @@ async def sign_up(
 ) -> ApiResult[str]:
     token = await service.sign_up(data)
     return ApiResult(success=True, message="Sign up was success", data=token)
+
+
+@router.post("/logout")
+async def logout(
+    _: Authentication,
+    token: str = Depends(oauth2_scheme)
+) -> ApiResult[bool]:
+    await revoke_token(token)
+    return ApiResult(success=True, message="Logout was success", data=True)
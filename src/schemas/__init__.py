@@ -11,3 +11,4 @@ class ApiResult(BaseModel, Generic[RSP]):
 	success: bool
 	message: Optional[str] = None
 	data: Optional[RSP] = None
+	next_cursor: Optional[str] = None
@@ -1,7 +1,7 @@
 from typing import List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
-from config import MAX_POST_SIZE
+from config import MAX_POST_SIZE, MAX_POST_BATCH
 
 
 class AddPostSchema(BaseModel):
@@ -9,6 +9,8 @@ class AddPostSchema(BaseModel):
 
 
 class PostSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     text: str
 
@@ -19,3 +21,22 @@ class GetPostsSchema(BaseModel):
 
 class DeletePostSchema(BaseModel):
     post_id: int
+
+
+class AddPostsBatchSchema(BaseModel):
+    posts: List[AddPostSchema] = Field(..., min_length=1, max_length=MAX_POST_BATCH)
+
+    @model_validator(mode='after')
+    def check_total_size(self) -> 'AddPostsBatchSchema':
+        if sum(len(post.text) for post in self.posts) > MAX_POST_SIZE:
+            raise ValueError(f'Total text size of a batch must not exceed {MAX_POST_SIZE} characters')
+        return self
+
+
+class DeletePostsBatchSchema(BaseModel):
+    post_ids: List[int] = Field(..., min_length=1, max_length=MAX_POST_BATCH)
+
+
+class DeletedPostSchema(BaseModel):
+    post_id: int
+    deleted: bool
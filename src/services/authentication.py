@@ -1,5 +1,9 @@
 import jwt
+import time
+import asyncio
+import hashlib
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
 from typing import Annotated
@@ -7,31 +11,112 @@ from typing import Annotated
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 
+from database.async_redis import CacheDB, cache_counter
+
 from schemas import UserSchema
 
 from config import get_config
 
+from utils.instrumentation import span
+from utils.lru import LRUCache
+
 config = get_config()
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# hex_sha256 only verifies passwords stored before bcrypt; they are rehashed on the next successful login
+pwd_context = CryptContext(schemes=["bcrypt", "hex_sha256"], deprecated=["hex_sha256"])
+# bcrypt releases the GIL, so a few threads keep ~100ms hashes off the event loop without starving the CPU
+password_executor = ThreadPoolExecutor(
+    max_workers=config.jwt.password_hash_workers,
+    thread_name_prefix="password-hash",
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# sha256(token) -> (user, exp); a hit skips signature verification until the token expires
+verified_tokens: LRUCache[str, tuple[UserSchema, float]] = LRUCache(config.jwt.token_cache_size)
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoked_token_key(digest: str) -> str:
+    return f"auth:revoked:{digest}"
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """Returns whether the password matches and, for outdated hashes, its replacement hash."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify_and_update, password, password_hash)
+
 
 async def create_access_token(data: UserSchema) -> str:
-    to_encode = data.copy()
+    to_encode = data.model_dump()
     expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=config.jwt.access_token_expire_minutes)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, config.jwt.secret_key, algorithm=config.jwt.algorithm)
 
 
-async def authenticate(token: str = Depends(oauth2_scheme)):
+async def revoke_token(token: str) -> None:
+    """Denylists the token in Redis until it expires; verify_token checks the denylist before its cache."""
+    if not config.jwt.revocation_enabled:
+        # Without the check in verify_token the token would keep working, so don't pretend it was revoked
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Token revocation is disabled")
+
+    payload = jwt.decode(
+        token,
+        config.jwt.secret_key,
+        algorithms=[config.jwt.algorithm],
+        options={"verify_exp": False},
+    )
+    digest = token_digest(token)
+    ttl = int(payload["exp"] - time.time())
+
+    verified_tokens.pop(digest)
+    if ttl > 0:
+        await CacheDB().set(revoked_token_key(digest), 1, ttl)
+
+
+async def verify_token(token: str):
+    digest = token_digest(token)
+
+    if config.jwt.revocation_enabled and await CacheDB().exists(revoked_token_key(digest)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+
+    counter = cache_counter("verified_tokens")
+    cached = verified_tokens.get(digest)
+
+    if cached is not None:
+        counter.hit()
+        user, expires_at = cached
+        if expires_at <= time.time():
+            verified_tokens.pop(digest)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+        return user
+
+    counter.miss()
+
     try:
         payload = jwt.decode(token, config.jwt.secret_key, algorithms=[config.jwt.algorithm])
-        return UserSchema(**payload)
+        user = UserSchema(**payload)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+    if "exp" in payload:
+        verified_tokens.set(digest, (user, payload["exp"]))
+
+    return user
+
+
+async def authenticate(token: str = Depends(oauth2_scheme)):
+    with span("auth"):
+        return await verify_token(token)
+
 Authentication = Annotated[UserSchema, Depends(authenticate)]
@@ -1,17 +1,57 @@
-import json
-from typing import List
+import time
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
 from dataclasses import dataclass
 
 from fastapi import HTTPException
 
-from database.async_redis import CacheDB
+from config import get_config, POST_PAGE_DEFAULT_LIMIT, POST_PAGE_MAX_LIMIT
+
+from database.async_redis import CacheDB, cache_counter, INCR_IF_EXISTS
 
 from models.post import Post
 
-from schemas import PostSchema, AddPostSchema
+from schemas import ApiResult, PostSchema, AddPostSchema, AddPostsBatchSchema, DeletedPostSchema
 
 from repositories import PostRepository
 
+from utils.pagination import encode_cursor, decode_cursor, InvalidCursor
+from utils.single_flight import SingleFlight, refresh_early
+
+from .post_writer import (
+	post_ids, queue_post, highest_queued_id, pending_posts_key, delete_pending,
+)
+
+
+def post_list_cache_key(user_id: int) -> str:
+	return f"user:{user_id}:posts"
+
+
+def post_count_cache_key(user_id: int) -> str:
+	return f"user:{user_id}:posts:count"
+
+
+def post_list_version_key(user_id: int) -> str:
+	return f"user:{user_id}:posts:version"
+
+
+# Version keys of inactive users expire; a re-created one starts from the current time in microseconds,
+# so it never repeats a version (and thus an ETag) that was handed out before.
+POST_LIST_VERSION_TTL = 30 * 24 * 3600
+
+
+def post_list_etag(version: str, limit: int, cursor: Optional[str]) -> str:
+	return f'"{version}-{limit}-{cursor or ""}"'
+
+
+post_page_flights: SingleFlight[bytes] = SingleFlight()
+
+
+@dataclass
+class CachedResponse:
+	body: bytes
+	etag: str
+
 
 @dataclass
 class PostService:
@@ -19,7 +59,44 @@ class PostService:
 	redis: CacheDB
 
 
+	def _queue_posts_changed(self, pipe, user_id: int, delta: int) -> str:
+		cache_key = post_list_cache_key(user_id)
+		pipe.delete(cache_key)
+		pipe.eval(INCR_IF_EXISTS, 1, post_list_version_key(user_id), 1)
+		if delta:
+			pipe.eval(INCR_IF_EXISTS, 1, post_count_cache_key(user_id), delta)
+		self.redis.publish_invalidation(pipe, cache_key)
+		return cache_key
+
+
+	async def _posts_changed(self, user_id: int, delta: int) -> None:
+		async with self.redis.pipeline() as pipe:
+			cache_key = self._queue_posts_changed(pipe, user_id, delta)
+			await pipe.execute()
+		# Don't wait for our own pub/sub message, so this worker reads its writes right away
+		self.redis.evict_local(cache_key)
+
+
+	async def _post_id_floor(self) -> int:
+		return max(await self.post_repo.max_id(), await highest_queued_id(self.redis))
+
+
+	def _local_get(self, user_id: int, key: str, counter_name: str) -> Any:
+		if self.redis.local is None:
+			return None
+		value = self.redis.local_get(post_list_cache_key(user_id), key)
+		counter = cache_counter(f"{counter_name}:l1")
+		if value is not None:
+			counter.hit()
+		else:
+			counter.miss()
+		return value
+
+
 	async def create_post(self, data: AddPostSchema, user_id: int) -> int:
+		if get_config().posts.write_behind:
+			return await self._queue_post(data.text, user_id)
+
 		new_post = await self.post_repo.add(
 			Post(
 				user_id=user_id,
@@ -27,30 +104,263 @@ class PostService:
 			)
 		)
 
+		await self._posts_changed(user_id, 1)
+
 		return new_post.id
 
 
-	async def get_all_posts(self, user_id: int) -> List[PostSchema]:
-		cache_key = f"user:{user_id}:posts"
-		cached_posts = await self.redis.get(cache_key)
+	async def _queue_post(self, text: str, user_id: int) -> int:
+		"""Write-behind: the post goes to the stream, PostWriter inserts it; until then reads see it as pending."""
+		(post_id,) = await post_ids.allocate(self.redis, 1, self._post_id_floor)
 
-		if cached_posts:
-			return [PostSchema(**post) for post in json.loads(cached_posts)]
+		# MULTI/EXEC: the queued post, its pending entries and the list version bump land together
+		async with self.redis.pipeline() as pipe:
+			queue_post(pipe, post_id, user_id, text)
+			cache_key = self._queue_posts_changed(pipe, user_id, 1)
+			await pipe.execute()
+		self.redis.evict_local(cache_key)
 
-		posts = await self.post_repo.find_all_by({"user_id": user_id})
-		post_list = [PostSchema.from_orm(post) for post in posts]
+		return post_id
 
-		await self.redis.set(json.dumps([post.dict() for post in post_list]), cache_key, 300)
 
-		return post_list
+	async def create_posts(self, data: AddPostsBatchSchema, user_id: int) -> List[int]:
+		if get_config().posts.write_behind:
+			# Auto-increment ids could collide with ids already handed out to queued posts
+			ids = await post_ids.allocate(self.redis, len(data.posts), self._post_id_floor)
+			await self.post_repo.add_many_ignoring_existing(
+				[{"id": post_id, "user_id": user_id, "text": post.text} for post_id, post in zip(ids, data.posts)]
+			)
+			await self._posts_changed(user_id, len(ids))
+			return ids
 
+		new_posts = await self.post_repo.add_many(
+			[
+				Post(
+					user_id=user_id,
+					text=post.text
+				)
+				for post in data.posts
+			]
+		)
 
-	async def delete_post(self, post_id: int):
-		post = await self.post_repo.find_one(post_id)
+		await self._posts_changed(user_id, len(new_posts))
 
-		if not post:
-			raise HTTPException(404, f'Post with id {post_id} not found')
+		return [post.id for post in new_posts]
+
+
+	async def get_posts_etag(self, user_id: int, limit: int = POST_PAGE_DEFAULT_LIMIT, cursor: Optional[str] = None) -> str:
+		version = self._local_get(user_id, "version", "post_list_version")
+		if version is None:
+			version = await self.redis.get_or_init(
+				post_list_version_key(user_id),
+				time.time_ns() // 1000,
+				POST_LIST_VERSION_TTL,
+			)
+			self.redis.local_set(post_list_cache_key(user_id), "version", version)
+		return post_list_etag(version, min(limit, POST_PAGE_MAX_LIMIT), cursor)
+
+
+	async def get_all_posts(
+		self,
+		user_id: int,
+		limit: int = POST_PAGE_DEFAULT_LIMIT,
+		cursor: Optional[str] = None,
+		etag: Optional[str] = None,
+	) -> CachedResponse:
+		"""Serialised ApiResult page; cache hits are served as stored, without a Pydantic round-trip."""
+		limit = min(limit, POST_PAGE_MAX_LIMIT)
+
+		try:
+			# Pages are keyed on the post id alone
+			after = decode_cursor(cursor, (int,))
+		except InvalidCursor:
+			raise HTTPException(400, 'Invalid cursor')
 
-		await self.post_repo.delete(post_id)
+		# The ETag names the list version, so a page loaded just before a write lands in a field nobody reads
+		etag = etag or await self.get_posts_etag(user_id, limit, cursor)
+		body = self._local_get(user_id, etag, "post_list")
+		if body is not None:
+			return CachedResponse(body=body, etag=etag)
+
+		cache_key = post_list_cache_key(user_id)
+		config = get_config().cache
+		counter = cache_counter("post_list")
+		(body, compute_ms), ttl_ms = await self.redis.hmget_raw_with_pttl(cache_key, etag, f"{etag}:ms")
+
+		if body is not None:
+			if not refresh_early(float(compute_ms or 0), ttl_ms, config.xfetch_beta):
+				counter.hit()
+				self.redis.local_set(cache_key, etag, body)
+				return CachedResponse(body=body, etag=etag)
+			counter.early_refreshes += 1
+		else:
+			counter.miss()
+
+		flight_key = f"{cache_key}:{etag}"
+		if post_page_flights.in_flight(flight_key):
+			counter.coalesced += 1
+
+		body = await post_page_flights.do(flight_key, lambda: self._load_posts_page(user_id, limit, after, etag))
+		self.redis.local_set(cache_key, etag, body)
+		return CachedResponse(body=body, etag=etag)
+
+
+	async def _load_posts_page(self, user_id: int, limit: int, after: Optional[tuple], etag: str) -> bytes:
+		cache_key = post_list_cache_key(user_id)
+		config = get_config().cache
+		lock_key, lock = f"lock:{cache_key}:{etag}", None
+
+		if config.distributed_lock:
+			lock = await self.redis.acquire_lock(lock_key, config.lock_timeout_ms)
+			if lock is None:
+				body = await self._wait_for_page(cache_key, etag, config.lock_timeout_ms)
+				if body is not None:
+					return body
+
+		try:
+			started = time.perf_counter()
+			posts, next_after = await self.post_repo.find_page_by(
+				{"user_id": user_id},
+				limit=limit,
+				after=after,
+			)
+			posts = [PostSchema.model_validate(post) for post in posts]
+			if get_config().posts.write_behind:
+				posts, next_after = await self._merge_pending(user_id, posts, next_after, limit, after)
+			page = ApiResult[List[PostSchema]](
+				success=True,
+				message="All posts was retreived",
+				data=posts,
+				next_cursor=encode_cursor(next_after) if next_after else None,
+			)
+			body = page.model_dump_json().encode()
+			compute_ms = (time.perf_counter() - started) * 1000
+
+			await self.redis.hset(
+				cache_key,
+				mapping={etag: body, f"{etag}:ms": round(compute_ms, 3)},
+				expire_time=config.post_list_ttl,
+			)
+			return body
+		finally:
+			if lock is not None:
+				await self.redis.release_lock(lock_key, lock)
+
+
+	async def _merge_pending(
+		self,
+		user_id: int,
+		posts: List[PostSchema],
+		next_after: Optional[tuple],
+		limit: int,
+		after: Optional[tuple],
+	) -> tuple[List[PostSchema], Optional[tuple]]:
+		"""Adds the user's queued posts to a page, so a post is listed from the moment /post/add returns."""
+		pending = await self.redis.hgetall(pending_posts_key(user_id))
+		if not pending:
+			return posts, next_after
+
+		merged = {post.id: post for post in posts}
+		for post_id, text in pending.items():
+			if after is None or int(post_id) > after[0]:
+				# Already written and not yet cleared from the hash: the row from the database wins
+				merged.setdefault(int(post_id), PostSchema(id=int(post_id), text=text))
+
+		ordered = sorted(merged.values(), key=lambda post: post.id)
+		page = ordered[:limit]
+		more = len(ordered) > limit or next_after is not None
+		return page, ((page[-1].id,) if more and page else None)
+
+
+	async def _wait_for_page(self, cache_key: str, etag: str, timeout_ms: int, poll_ms: int = 25) -> Optional[bytes]:
+		"""Another worker holds the lock and is loading this page; wait for it to show up in Redis."""
+		for _ in range(timeout_ms // poll_ms):
+			await asyncio.sleep(poll_ms / 1000)
+			(body,) = await self.redis.hmget_raw(cache_key, etag)
+			if body is not None:
+				return body
+		return None
+
+
+	async def count_posts(self, user_id: int, exact: bool = False) -> int:
+		cache_key = post_count_cache_key(user_id)
+		counter = cache_counter("post_count")
+
+		if not exact:
+			cached_count = self._local_get(user_id, "count", "post_count")
+			if cached_count is not None:
+				return cached_count
+			cached_count = await self.redis.get(cache_key)
+			if cached_count is not None:
+				counter.hit()
+				self.redis.local_set(post_list_cache_key(user_id), "count", int(cached_count))
+				return int(cached_count)
+			counter.miss()
+
+		# The counter expires after the reconcile interval, so drift from a lost increment
+		# is corrected by the next recount; an exact count re-seeds it right away.
+		total = await self.post_repo.count_by({"user_id": user_id})
+		if get_config().posts.write_behind:
+			pending = [int(post_id) for post_id in await self.redis.hgetall(pending_posts_key(user_id))]
+			if pending:
+				# Rows PostWriter has inserted but not yet cleared from the hash are already in `total`
+				written = await self.post_repo.count_by({"user_id": user_id, "id": {"$in": pending}})
+				total += len(pending) - written
+		await self.redis.set(cache_key, total, get_config().cache.post_count_reconcile_interval)
+		self.redis.local_set(post_list_cache_key(user_id), "count", total)
+
+		return total
+
+
+	async def export_posts(self, user_id: int) -> AsyncIterator[bytes]:
+		# Queued posts are merged in id order, so the export has every post /post/add has acknowledged
+		pending = {}
+		if get_config().posts.write_behind:
+			pending = {int(post_id): text for post_id, text in (await self.redis.hgetall(pending_posts_key(user_id))).items()}
+		queued = sorted(pending)
+
+		async with self.post_repo.db_session:
+			async for post in self.post_repo.stream_all_by({"user_id": user_id}):
+				while queued and queued[0] < post.id:
+					post_id = queued.pop(0)
+					yield PostSchema(id=post_id, text=pending[post_id]).model_dump_json().encode() + b"\n"
+				if queued and queued[0] == post.id:
+					# Already written and not yet cleared from the hash: the row from the database wins
+					queued.pop(0)
+				yield PostSchema.model_validate(post).model_dump_json().encode() + b"\n"
+
+		for post_id in queued:
+			yield PostSchema(id=post_id, text=pending[post_id]).model_dump_json().encode() + b"\n"
+
+
+	async def delete_post(self, post_id: int, user_id: int):
+		# Another user's post is reported exactly like a missing one
+		if not await self._delete_owned([post_id], user_id):
+			raise HTTPException(404, f'Post with id {post_id} not found')
 
 		return True
+
+
+	async def _delete_owned(self, post_ids: List[int], user_id: int) -> set[int]:
+		deleted = {post.id for post in await self.post_repo.delete_many_returning(post_ids, {"user_id": user_id})}
+
+		missing = [post_id for post_id in post_ids if post_id not in deleted]
+		if missing and get_config().posts.write_behind:
+			# Queued but not written yet: a tombstone tells PostWriter to drop it (or delete it again if it raced)
+			tombstoned = await delete_pending(self.redis, user_id, missing)
+			deleted |= tombstoned
+			# No longer pending because PostWriter wrote it after our DELETE: it is in the table now
+			written = [post_id for post_id in missing if post_id not in tombstoned]
+			if written:
+				rows = await self.post_repo.delete_many_returning(written, {"user_id": user_id})
+				deleted |= {post.id for post in rows}
+
+		if deleted:
+			await self._posts_changed(user_id, -len(deleted))
+
+		return deleted
+
+
+	async def delete_posts(self, post_ids: List[int], user_id: int) -> List[DeletedPostSchema]:
+		deleted_ids = await self._delete_owned(post_ids, user_id)
+		return [DeletedPostSchema(post_id=post_id, deleted=post_id in deleted_ids) for post_id in post_ids]
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable
+
+from sqlalchemy.exc import DataError, IntegrityError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+from config import get_config
+
+from database.async_redis import CacheDB
+from database.database import SQLAlchemyManager, db
+
+from models.post import Post
+
+from repositories import PostRepository
+
+
+POST_ID_KEY = "posts:next-id"
+POST_STREAM = "posts:write-behind"
+POST_STREAM_GROUP = "post-writers"
+POST_DEAD_LETTERS = "posts:write-behind:dead"
+# post id -> owner, for every post queued but not yet in the database
+PENDING_OWNERS = "posts:pending"
+# Queued posts deleted before they were written; the consumer drops them
+PENDING_TOMBSTONES = "posts:pending:deleted"
+
+
+def pending_posts_key(user_id: int) -> str:
+	return f"user:{user_id}:posts:pending"
+
+
+# Deleting queued posts and PostWriter settling written ones are each one script, so they never interleave:
+# either the delete finds the owner entry and leaves a tombstone the writer sees, or the writer has cleared
+# it and the row is in the table, where the caller deletes it instead.
+
+# KEYS: owners, tombstones, the user's pending hash; ARGV: user id, post ids. Returns the ids it tombstoned.
+DELETE_PENDING = """
+local deleted = {}
+for i = 2, #ARGV do
+	if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[1] then
+		redis.call('SADD', KEYS[2], ARGV[i])
+		redis.call('HDEL', KEYS[1], ARGV[i])
+		redis.call('HDEL', KEYS[3], ARGV[i])
+		table.insert(deleted, ARGV[i])
+	end
+end
+return deleted
+"""
+
+# KEYS: owners, tombstones, then each post's pending hash; ARGV: the post ids. Returns the tombstoned ids.
+SETTLE_PENDING = """
+local tombstoned = {}
+for i, id in ipairs(ARGV) do
+	redis.call('HDEL', KEYS[1], id)
+	redis.call('HDEL', KEYS[i + 2], id)
+	if redis.call('SISMEMBER', KEYS[2], id) == 1 then
+		table.insert(tombstoned, id)
+	end
+end
+return tombstoned
+"""
+
+
+async def delete_pending(redis: CacheDB, user_id: int, post_ids: list[int]) -> set[int]:
+	"""Tombstones those of `post_ids` that are queued and owned by `user_id`; returns them."""
+	deleted = await redis.run_script(
+		DELETE_PENDING, [PENDING_OWNERS, PENDING_TOMBSTONES, pending_posts_key(user_id)], [user_id, *post_ids],
+	)
+	return {int(post_id) for post_id in deleted}
+
+
+class PostIdAllocator:
+	"""Hands out post ids from blocks reserved in Redis with one INCRBY, so creating a post needs no INSERT."""
+
+	def __init__(self):
+		self._next = 0
+		self._end = -1
+		self._lock = asyncio.Lock()
+
+	async def allocate(self, redis: CacheDB, count: int, floor: Callable[[], Awaitable[int]]) -> list[int]:
+		ids = []
+		while len(ids) < count:
+			if self._next > self._end:
+				async with self._lock:
+					if self._next > self._end:
+						await self._reserve(redis, max(get_config().posts.id_block_size, count - len(ids)), floor)
+			take = min(count - len(ids), self._end - self._next + 1)
+			ids.extend(range(self._next, self._next + take))
+			self._next += take
+		return ids
+
+	async def _reserve(self, redis: CacheDB, size: int, floor: Callable[[], Awaitable[int]]) -> None:
+		end = await redis.incr_if_exists(POST_ID_KEY, size)
+		if end is None:
+			# First use, or Redis lost the key: continue above every id the database or the queue has seen
+			await redis.get_or_init(POST_ID_KEY, await floor())
+			end = await redis.incr(POST_ID_KEY, size)
+		self._next, self._end = end - size + 1, end
+
+	async def raise_floor(self, redis: CacheDB, floor: int) -> None:
+		# Posts inserted with auto-increment ids while write-behind was off may be above the stored counter
+		await redis.set_if_greater(POST_ID_KEY, floor)
+
+
+post_ids = PostIdAllocator()
+
+
+def queue_post(pipe, post_id: int, user_id: int, text: str) -> None:
+	pipe.xadd(POST_STREAM, {"id": post_id, "user_id": user_id, "text": text})
+	pipe.hset(pending_posts_key(user_id), post_id, text)
+	pipe.hset(PENDING_OWNERS, post_id, user_id)
+
+
+async def highest_queued_id(redis: CacheDB) -> int:
+	newest = await redis.newest_entry(POST_STREAM)
+	return int(newest["id"]) if newest else 0
+
+
+@dataclass
+class PostWriterStats:
+	batches: int = 0
+	rows_written: int = 0
+	duplicates_skipped: int = 0
+	tombstoned: int = 0
+	retries: int = 0
+	dead_lettered: int = 0
+	last_batch_size: int = 0
+	last_flush_ms: float = 0.0
+
+
+writer_stats = PostWriterStats()
+
+
+async def post_writer_stats() -> dict[str, float]:
+	if not get_config().posts.write_behind:
+		return {}
+	depth, oldest = await CacheDB().stream_backlog(POST_STREAM)
+	lag_ms = max(0, time.time() * 1000 - int(oldest.split("-")[0])) if oldest else 0
+	return {**asdict(writer_stats), "queue_depth": depth, "lag_ms": round(lag_ms, 1)}
+
+
+# Errors worth retrying as they are: the database or the connection to it, not the rows
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError)
+PERMANENT_ERRORS = (IntegrityError, DataError)
+
+
+class PostWriter:
+	"""Drains the write-behind stream into the posts table in batched multi-row INSERTs."""
+
+	def __init__(self, redis: CacheDB):
+		self.redis = redis
+		self.config = get_config().posts
+		self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+		self.log = logging.getLogger(self.__class__.__name__)
+
+	async def run(self) -> None:
+		ready, failures = False, 0
+		while True:
+			try:
+				if not ready:
+					await self._prepare()
+					ready = True
+				# Entries another worker took and never acknowledged (it died, or its batch kept failing) go first
+				entries = await self.redis.claim_stale(
+					POST_STREAM, POST_STREAM_GROUP, self.consumer, self.config.claim_idle_ms, self.config.batch_size,
+				) or await self.redis.read_group(
+					POST_STREAM, POST_STREAM_GROUP, self.consumer, self.config.batch_size, self.config.block_ms,
+				)
+				if entries:
+					await self.flush(entries)
+				failures = 0
+			except asyncio.CancelledError:
+				raise
+			except Exception:
+				# Unacknowledged entries stay pending and are claimed again after claim_idle_ms
+				failures += 1
+				self.log.exception("Post write-behind batch failed" if ready else "Post write-behind consumer failed to start")
+				await asyncio.sleep(min(0.1 * 2 ** failures, 30))
+
+	async def _prepare(self) -> None:
+		await self.redis.ensure_group(POST_STREAM, POST_STREAM_GROUP)
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			await post_ids.raise_floor(self.redis, await PostRepository(session, Post).max_id())
+
+	async def flush(self, entries: list[tuple[str, dict | None]]) -> None:
+		started = time.perf_counter()
+		rows = [
+			{"id": int(fields["id"]), "user_id": int(fields["user_id"]), "text": fields["text"]}
+			for _, fields in entries
+			if fields
+		]
+		ids = [row["id"] for row in rows]
+		deleted = await self._tombstoned(ids)
+		live = [row for row in rows if row["id"] not in deleted]
+
+		inserted = await self._insert_with_retry(live)
+		collided = await self._collisions(live) if inserted < len(live) else []
+		for row in collided:
+			await self._dead_letter(row, f"Post id {row['id']} is already taken by another post")
+		# From here on deletes go to the table; one that raced with this batch left a tombstone instead,
+		# and the row went in after all, so take it out again
+		late = (await self._settle(rows)) - deleted - {row["id"] for row in collided}
+		if late:
+			await self._delete_rows(late)
+
+		async with self.redis.pipeline(transaction=False) as pipe:
+			entry_ids = [entry_id for entry_id, _ in entries]
+			pipe.xack(POST_STREAM, POST_STREAM_GROUP, *entry_ids)
+			pipe.xdel(POST_STREAM, *entry_ids)
+			if ids:
+				pipe.srem(PENDING_TOMBSTONES, *ids)
+			await pipe.execute()
+
+		writer_stats.batches += 1
+		writer_stats.rows_written += inserted
+		writer_stats.duplicates_skipped += len(live) - inserted - len(collided)
+		writer_stats.tombstoned += len(deleted | late)
+		writer_stats.last_batch_size = len(rows)
+		writer_stats.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+	async def _tombstoned(self, ids: list[int]) -> set[int]:
+		if not ids:
+			return set()
+		flags = await self.redis.smismember(PENDING_TOMBSTONES, ids)
+		return {post_id for post_id, flag in zip(ids, flags) if flag}
+
+	async def _settle(self, rows: list[dict]) -> set[int]:
+		if not rows:
+			return set()
+		tombstoned = await self.redis.run_script(
+			SETTLE_PENDING,
+			[PENDING_OWNERS, PENDING_TOMBSTONES, *(pending_posts_key(row["user_id"]) for row in rows)],
+			[row["id"] for row in rows],
+		)
+		return {int(post_id) for post_id in tombstoned}
+
+	async def _insert_with_retry(self, rows: list[dict]) -> int:
+		for attempt in range(self.config.max_retries + 1):
+			try:
+				return await self._insert(rows)
+			except PERMANENT_ERRORS:
+				# Some row can never be written (e.g. its user is gone); write the others one by one
+				return await self._insert_isolating_bad_rows(rows)
+			except TRANSIENT_ERRORS:
+				if attempt == self.config.max_retries:
+					raise
+				writer_stats.retries += 1
+				await asyncio.sleep(0.05 * 2 ** attempt)
+		return 0
+
+	async def _insert_isolating_bad_rows(self, rows: list[dict]) -> int:
+		inserted = 0
+		for row in rows:
+			try:
+				inserted += await self._insert([row])
+			except PERMANENT_ERRORS as error:
+				await self._dead_letter(row, str(error))
+		return inserted
+
+	async def _collisions(self, rows: list[dict]) -> list[dict]:
+		"""
+		Rows the INSERT skipped because another post already has their id, e.g. one inserted with an
+		auto-increment id by a worker running without write-behind. A redelivered row finds itself instead.
+		"""
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			stored = await PostRepository(session, Post).find_all_by({"id": {"$in": [row["id"] for row in rows]}})
+		stored = {post.id: (post.user_id, post.text) for post in stored}
+		return [
+			row for row in rows
+			if row["id"] in stored and stored[row["id"]] != (row["user_id"], row["text"])
+		]
+
+	async def _dead_letter(self, row: dict, error: str) -> None:
+		self.log.error("Dead-lettering post %s: %s", row["id"], error)
+		await self.redis.xadd(POST_DEAD_LETTERS, {**row, "error": error[:500]})
+		writer_stats.dead_lettered += 1
+
+	async def _insert(self, rows: list[dict]) -> int:
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			return await PostRepository(session, Post).add_many_ignoring_existing(rows)
+
+	async def _delete_rows(self, ids: set[int]) -> None:
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			await PostRepository(session, Post).delete_many_returning(list(ids))
+
+
+async def run_post_writer() -> None:
+	await PostWriter(CacheDB()).run()
@@ -1,13 +1,13 @@
-import hashlib
 from dataclasses import dataclass
 
 from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
 
 from models.user import User
 
 from schemas.user import LoginSchema, SignUpSchemas, UserSchema
 
-from .authentication import create_access_token
+from .authentication import create_access_token, hash_password, verify_password
 
 from repositories import UserRepository
 
@@ -18,44 +18,36 @@ class UserService:
 
 
 	async def login(self, data: LoginSchema) -> str:
-		user = await self.user_repo.find_one_by(
-			{
-				"login": data.login
-			}
-		)
+		user = await self.user_repo.find_credentials(data.login)
 
 		if not user:
 			raise HTTPException(404, 'User not found')
 
-		password_sha = hashlib.sha256(data.password.encode()).hexdigest()
+		valid, new_hash = await verify_password(data.password, user.password_sha256)
 
-		if user.password_sha256 != password_sha:
+		if not valid:
 			raise HTTPException(409, 'Password is wrong')
 
-		token = await create_access_token(UserSchema.from_orm(User))
+		if new_hash:
+			await self.user_repo.upd(user.id, password_sha256=new_hash)
+
+		token = await create_access_token(UserSchema(id=user.id, login=user.login))
 
 		return token
 
 
 	async def sign_up(self, data: SignUpSchemas) -> str:
-		existing_user = await self.user_repo.find_one_by(
-			{
-				'login': data.login
-			}
-		)
-
-		if existing_user:
-			raise HTTPException(409, 'User with this login was found')
-
-		password_sha = hashlib.sha256(data.password.encode()).hexdigest()
-
 		new_user = User(
 			login=data.login,
-			password_sha256=password_sha
+			password_sha256=await hash_password(data.password)
 		)
 
-		await self.user_repo.add(new_user)
+		# A single INSERT; the unique index on users.login rejects duplicates, including concurrent sign-ups
+		try:
+			await self.user_repo.add(new_user)
+		except IntegrityError:
+			raise HTTPException(409, 'User with this login was found')
 
-		token = await create_access_token(UserSchema.from_orm(User))
+		token = await create_access_token(UserSchema(id=new_user.id, login=new_user.login))
 
 		return token
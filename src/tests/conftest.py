@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import prepare_environment  # noqa: E402
+
+# Project modules read their settings at import time; point them at a throwaway SQLite file first
+prepare_environment(None, tempfile.mkdtemp(prefix="tests-"))
+
+
+@pytest.fixture
+def run():
+	"""Runs a coroutine on a fresh event loop, then drops the engine's connections bound to that loop."""
+	from database.database import SQLAlchemyManager, db
+
+	def runner(coro):
+		async def wrapped():
+			try:
+				return await coro
+			finally:
+				await SQLAlchemyManager.get_async_engine(db).dispose()
+		return asyncio.run(wrapped())
+
+	return runner
+
+
+@pytest.fixture(autouse=True)
+def keep_password_executor(monkeypatch):
+	"""The app's lifespan shuts the hashing executor down; tests start the app more than once per process."""
+	from services.authentication import password_executor
+
+	monkeypatch.setattr(password_executor, "shutdown", lambda *args, **kwargs: None)
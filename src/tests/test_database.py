@@ -0,0 +1,29 @@
+import logging
+
+from sqlalchemy import insert, select
+
+from database import Base
+from database import database
+from database.database import SQLAlchemyManager, db
+from models.post import Post  # noqa: F401 (User.posts needs it mapped)
+from models.user import User
+
+
+def test_failed_transaction_id_lookup_does_not_abort_the_commit(run, monkeypatch):
+	# As on MySQL without the PROCESS privilege: the debug-only lookup fails, the write must still commit
+	monkeypatch.setitem(database.TRANSACTION_ID_QUERIES, "sqlite", "SELECT trx_id FROM no_such_table")
+	monkeypatch.setattr(SQLAlchemyManager.logger, "level", logging.DEBUG)
+
+	async def scenario():
+		async with SQLAlchemyManager.get_async_engine(db).begin() as conn:
+			await conn.run_sync(Base.metadata.create_all)
+
+		sessions = SQLAlchemyManager.get_async_session_generator(db)()
+		session = await anext(sessions)
+		await session.execute(insert(User), [{"login": "debug-commit", "password_sha256": "x"}])
+		await anext(sessions, None)
+
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			assert await session.scalar(select(User.id).where(User.login == "debug-commit")) is not None
+
+	run(scenario())
@@ -0,0 +1,11 @@
+from benchmarks.harness import percentile
+
+
+def test_percentile_is_nearest_rank():
+	samples = [float(value) for value in range(100, 0, -1)]
+	assert percentile(samples, 0.5) == 50.0
+	assert percentile(samples, 0.95) == 95.0
+	assert percentile(samples, 0.99) == 99.0
+	assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.0
+	assert percentile([7.0], 0.99) == 7.0
+	assert percentile([], 0.5) == 0.0
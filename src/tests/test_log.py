@@ -0,0 +1,35 @@
+import logging
+import os
+import time
+
+from utils.log import BufferedTimedRotatingFileHandler
+
+
+def record(message: str) -> logging.LogRecord:
+	return logging.LogRecord("test", logging.INFO, __file__, 1, message, None, None)
+
+
+def test_workers_sharing_a_file_rotate_it_once(tmp_path):
+	path = str(tmp_path / "app.log")
+	# One handler per worker process, all on the same file
+	workers = [
+		BufferedTimedRotatingFileHandler(path, when="midnight", encoding="utf-8", delay=True, batch_size=1)
+		for _ in range(3)
+	]
+	for index, handler in enumerate(workers):
+		handler.emit(record(f"yesterday {index}"))
+
+	# Midnight has passed: each worker rolls over on its next record
+	for handler in workers:
+		handler.rolloverAt = int(time.time()) - 1
+	for index, handler in enumerate(workers):
+		handler.emit(record(f"today {index}"))
+	for handler in workers:
+		handler.close()
+
+	backups = [name for name in os.listdir(tmp_path) if name.startswith("app.log.") and name != "app.log.rotation"]
+	assert len(backups) == 1
+	with open(tmp_path / backups[0]) as file:
+		assert file.read().splitlines() == ["yesterday 0", "yesterday 1", "yesterday 2"]
+	with open(path) as file:
+		assert file.read().splitlines() == ["today 0", "today 1", "today 2"]
@@ -0,0 +1,26 @@
+import pytest
+
+from utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_round_trip():
+	assert decode_cursor(encode_cursor((42,)), (int,)) == (42,)
+	assert decode_cursor(encode_cursor((7, "b")), (int, str)) == (7, "b")
+	assert decode_cursor(None, (int,)) is None
+	assert decode_cursor("", (int,)) is None
+
+
+@pytest.mark.parametrize("cursor", [
+	"not base64!",
+	encode_cursor(()),
+	encode_cursor((1, 2)),
+	encode_cursor(([1],)),
+	encode_cursor(("x",)),
+	encode_cursor((1.5,)),
+	encode_cursor((True,)),
+	encode_cursor((2 ** 40,)),
+	"eyJpZCI6IDF9",  # {"id": 1}
+])
+def test_rejects_malformed_cursors(cursor):
+	with pytest.raises(InvalidCursor):
+		decode_cursor(cursor, (int,))
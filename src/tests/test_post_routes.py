@@ -0,0 +1,29 @@
+import httpx
+
+from benchmarks.harness import running_app
+from config import get_config
+
+
+async def sign_up(client: httpx.AsyncClient, login: str) -> dict[str, str]:
+	response = await client.post("/user/sign-up", json={"login": login, "password": "password-123"})
+	return {"Authorization": f"Bearer {response.json()['data']}"}
+
+
+def test_delete_only_removes_the_callers_posts(run, monkeypatch):
+	async def scenario():
+		async with running_app() as app:
+			async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+				alice, bob = await sign_up(client, "delete-alice"), await sign_up(client, "delete-bob")
+				stored = (await client.post("/post/add", json={"text": "stored"}, headers=alice)).json()["data"]
+
+				# Queued by write-behind and not written yet (the consumer only starts with the app)
+				monkeypatch.setattr(get_config().posts, "write_behind", True)
+				queued = (await client.post("/post/add", json={"text": "queued"}, headers=alice)).json()["data"]
+
+				for post_id in (stored, queued):
+					response = await client.request("DELETE", "/post", json={"post_id": post_id}, headers=bob)
+					assert response.status_code == 404
+					response = await client.request("DELETE", "/post", json={"post_id": post_id}, headers=alice)
+					assert response.status_code == 200
+
+	run(scenario())
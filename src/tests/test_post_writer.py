@@ -0,0 +1,246 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+from config import get_config
+from database import Base
+from database.async_redis import CacheDB, InstrumentedConnectionPool
+from database.database import SQLAlchemyManager, db
+from models.post import Post
+from models.user import User
+from repositories import PostRepository
+from services.post import PostService
+from services.post_writer import (
+	POST_STREAM, POST_STREAM_GROUP, POST_DEAD_LETTERS, PENDING_OWNERS, PENDING_TOMBSTONES,
+	PostWriter, delete_pending, queue_post, pending_posts_key, writer_stats,
+)
+
+
+@pytest.fixture
+def redis():
+	from fakeredis import FakeServer
+	from fakeredis.aioredis import FakeConnection
+
+	return CacheDB(InstrumentedConnectionPool(
+		connection_class=FakeConnection,
+		server=FakeServer(),
+		decode_responses=True,
+		encoding="utf-8",
+	))
+
+
+async def prepare(redis: CacheDB) -> None:
+	async with SQLAlchemyManager.get_async_engine(db).begin() as conn:
+		await conn.run_sync(Base.metadata.create_all)
+	async with SQLAlchemyManager.get_async_session(db) as session:
+		await session.execute(delete(Post))
+		await session.execute(delete(User))
+		await session.execute(insert(User), [
+			{"id": 1, "login": "alice", "password_sha256": "x"},
+			{"id": 2, "login": "bob", "password_sha256": "x"},
+		])
+		await session.commit()
+	await redis.ensure_group(POST_STREAM, POST_STREAM_GROUP)
+
+
+async def enqueue(redis: CacheDB, *posts: tuple[int, int, str]) -> list:
+	async with redis.pipeline() as pipe:
+		for post_id, user_id, text in posts:
+			queue_post(pipe, post_id, user_id, text)
+		await pipe.execute()
+	return await redis.read_group(POST_STREAM, POST_STREAM_GROUP, "test", 100, 1)
+
+
+async def stored_posts() -> list[tuple[int, int, str]]:
+	async with SQLAlchemyManager.get_async_session(db) as session:
+		return (await session.execute(select(Post.id, Post.user_id, Post.text).order_by(Post.id))).all()
+
+
+def test_flush_writes_rows_and_clears_the_queue(run, redis):
+	async def scenario():
+		await prepare(redis)
+		entries = await enqueue(redis, (10, 1, "first"), (11, 1, "second"), (12, 2, "third"))
+		batches = writer_stats.batches
+
+		await PostWriter(redis).flush(entries)
+
+		assert await stored_posts() == [(10, 1, "first"), (11, 1, "second"), (12, 2, "third")]
+		assert writer_stats.batches == batches + 1
+		assert await redis.stream_backlog(POST_STREAM) == (0, None)
+		assert await redis.hlen(pending_posts_key(1)) == 0
+		assert await redis.hlen(PENDING_OWNERS) == 0
+
+	run(scenario())
+
+
+def test_flush_skips_redelivered_rows(run, redis):
+	async def scenario():
+		await prepare(redis)
+		entries = await enqueue(redis, (20, 1, "once"))
+		writer = PostWriter(redis)
+		skipped = writer_stats.duplicates_skipped
+
+		await writer.flush(entries)
+		await writer.flush(entries)
+
+		assert await stored_posts() == [(20, 1, "once")]
+		assert writer_stats.duplicates_skipped == skipped + 1
+		assert await redis.stream_backlog(POST_DEAD_LETTERS) == (0, None)
+
+	run(scenario())
+
+
+def test_flush_dead_letters_id_collisions(run, redis):
+	async def scenario():
+		await prepare(redis)
+		# Another writer already took the id, e.g. an auto-increment insert while write-behind was off
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			await session.execute(insert(Post), [{"id": 30, "user_id": 2, "text": "bob's"}])
+			await session.commit()
+		entries = await enqueue(redis, (30, 1, "alice's"), (31, 1, "fine"))
+
+		await PostWriter(redis).flush(entries)
+
+		assert await stored_posts() == [(30, 2, "bob's"), (31, 1, "fine")]
+		depth, _ = await redis.stream_backlog(POST_DEAD_LETTERS)
+		assert depth == 1
+		assert await redis.hlen(pending_posts_key(1)) == 0
+
+	run(scenario())
+
+
+def test_flush_drops_tombstoned_posts(run, redis):
+	async def scenario():
+		await prepare(redis)
+		entries = await enqueue(redis, (40, 1, "deleted"), (41, 1, "kept"))
+		await redis.redis.sadd(PENDING_TOMBSTONES, 40)
+
+		await PostWriter(redis).flush(entries)
+
+		assert await stored_posts() == [(41, 1, "kept")]
+		assert not any(await redis.smismember(PENDING_TOMBSTONES, [40]))
+
+	run(scenario())
+
+
+def test_run_retries_a_failed_start(run, redis, monkeypatch):
+	async def scenario():
+		await prepare(redis)
+		ensure_group, calls = redis.ensure_group, []
+
+		async def flaky_ensure_group(*args):
+			calls.append(args)
+			if len(calls) == 1:
+				raise ConnectionError("Redis is not up yet")
+			await ensure_group(*args)
+
+		monkeypatch.setattr(redis, "ensure_group", flaky_ensure_group)
+		monkeypatch.setattr(get_config().posts, "block_ms", 10)
+		async with redis.pipeline() as pipe:
+			queue_post(pipe, 50, 1, "after the retry")
+			await pipe.execute()
+
+		task = asyncio.create_task(PostWriter(redis).run())
+		try:
+			for _ in range(100):
+				if await stored_posts():
+					break
+				await asyncio.sleep(0.02)
+		finally:
+			task.cancel()
+
+		assert len(calls) == 2
+		assert await stored_posts() == [(50, 1, "after the retry")]
+
+	run(scenario())
+
+
+def test_delete_racing_a_flush_takes_the_row_out_again(run, redis):
+	async def scenario():
+		await prepare(redis)
+		entries = await enqueue(redis, (60, 1, "deleted while being written"))
+		writer = PostWriter(redis)
+		insert = writer._insert_with_retry
+
+		async def insert_then_delete(rows):
+			inserted = await insert(rows)
+			assert await delete_pending(redis, 1, [60]) == {60}
+			return inserted
+
+		writer._insert_with_retry = insert_then_delete
+		await writer.flush(entries)
+
+		assert await stored_posts() == []
+		assert not any(await redis.smismember(PENDING_TOMBSTONES, [60]))
+
+	run(scenario())
+
+
+def test_delete_after_a_flush_settled_the_post_deletes_the_row(run, redis, monkeypatch):
+	monkeypatch.setattr(get_config().posts, "write_behind", True)
+
+	async def scenario():
+		await prepare(redis)
+		entries = await enqueue(redis, (70, 1, "written between the two lookups"))
+
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			repo = PostRepository(session, Post)
+			delete_many, flushed = repo.delete_many_returning, []
+
+			async def delete_then_flush(*args):
+				deleted = await delete_many(*args)
+				if not flushed:
+					flushed.append(True)
+					await PostWriter(redis).flush(entries)
+				return deleted
+
+			repo.delete_many_returning = delete_then_flush
+			assert await PostService(repo, redis).delete_post(70, 1)
+
+		assert await stored_posts() == []
+
+	run(scenario())
+
+
+def test_batch_delete_drops_queued_posts(run, redis, monkeypatch):
+	monkeypatch.setattr(get_config().posts, "write_behind", True)
+
+	async def scenario():
+		await prepare(redis)
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			await session.execute(insert(Post), [{"id": 80, "user_id": 1, "text": "stored"}])
+			await session.commit()
+		entries = await enqueue(redis, (81, 1, "queued"), (82, 2, "someone else's"))
+
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			results = await PostService(PostRepository(session, Post), redis).delete_posts([80, 81, 82, 83], 1)
+		assert {result.post_id: result.deleted for result in results} == {80: True, 81: True, 82: False, 83: False}
+		assert await redis.hlen(pending_posts_key(1)) == 0
+
+		await PostWriter(redis).flush(entries)
+		assert await stored_posts() == [(82, 2, "someone else's")]
+
+	run(scenario())
+
+
+def test_export_includes_queued_posts_in_id_order(run, redis, monkeypatch):
+	monkeypatch.setattr(get_config().posts, "write_behind", True)
+
+	async def scenario():
+		await prepare(redis)
+		async with SQLAlchemyManager.get_async_session(db) as session:
+			await session.execute(insert(Post), [
+				{"id": 90, "user_id": 1, "text": "stored"},
+				{"id": 92, "user_id": 1, "text": "written, not yet cleared"},
+			])
+			await session.commit()
+		await enqueue(redis, (91, 1, "queued"), (92, 1, "written, not yet cleared"), (93, 1, "queued last"))
+
+		service = PostService(PostRepository(SQLAlchemyManager.get_async_session(db), Post), redis)
+		lines = [line async for line in service.export_posts(1)]
+
+		assert [json.loads(line)["id"] for line in lines] == [90, 91, 92, 93]
+
+	run(scenario())
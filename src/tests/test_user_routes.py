@@ -0,0 +1,38 @@
+import httpx
+
+from benchmarks.harness import running_app
+from config import get_config
+
+
+def test_logout_revokes_the_token(run, monkeypatch):
+	monkeypatch.setattr(get_config().jwt, "revocation_enabled", True)
+
+	async def scenario():
+		async with running_app() as app:
+			async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+				response = await client.post("/user/sign-up", json={"login": "logout-alice", "password": "password-123"})
+				headers = {"Authorization": f"Bearer {response.json()['data']}"}
+				# Verified once, so the token is in the in-process cache too
+				assert (await client.get("/post/count", headers=headers)).status_code == 200
+
+				assert (await client.post("/user/logout", headers=headers)).status_code == 200
+
+				assert (await client.get("/post/count", headers=headers)).status_code == 401
+				assert (await client.post("/user/logout", headers=headers)).status_code == 401
+
+	run(scenario())
+
+
+def test_logout_without_revocation_is_refused(run, monkeypatch):
+	monkeypatch.setattr(get_config().jwt, "revocation_enabled", False)
+
+	async def scenario():
+		async with running_app() as app:
+			async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+				response = await client.post("/user/sign-up", json={"login": "logout-bob", "password": "password-123"})
+				headers = {"Authorization": f"Bearer {response.json()['data']}"}
+
+				assert (await client.post("/user/logout", headers=headers)).status_code == 501
+				assert (await client.get("/post/count", headers=headers)).status_code == 200
+
+	run(scenario())
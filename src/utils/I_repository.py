@@ -1,7 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, desc, asc, func
+from sqlalchemy import select, insert, update, delete, and_, desc, asc, func, tuple_, bindparam, inspect, text, Integer
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.orm import joinedload
-from collections.abc import Iterable
+from collections.abc import AsyncIterator, Iterable, Sequence
 from typing import Any, TypeAlias
 
 from sqlalchemy.engine import Result
@@ -10,10 +11,74 @@ from sqlalchemy.sql import Select
 
 from typing import Generic, TypeVar, Type, List, Optional, Callable
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 
 T = TypeVar("T")
 ModelType = TypeVar("ModelType")
 Statement: TypeAlias = Any
+FilterSpec: TypeAlias = tuple[tuple[str, str], ...]
+
+# Filtered statements memoised by shape (model, filter keys and operators, joins, ordering, ...).
+# Values are bound per call, so every call reuses the same Select object, whose cache key is
+# memoised as well, and SQLAlchemy's compiled cache hits instead of rebuilding the statement.
+_statement_cache: dict[tuple, tuple[Select, frozenset[str]]] = {}
+
+class FilterError(ValueError):
+	pass
+
+
+def _single(value: Any) -> tuple:
+	return (value,)
+
+
+def _collection(value: Any) -> tuple:
+	if not isinstance(value, (list, tuple, set, frozenset)) or not value:
+		raise FilterError('$in expects a non-empty list')
+	return (list(value),)
+
+
+def _range(value: Any) -> tuple:
+	if not isinstance(value, (list, tuple)) or len(value) != 2:
+		raise FilterError('$between expects [low, high]')
+	return tuple(value)
+
+
+def _prefix(value: Any) -> tuple:
+	if not isinstance(value, str):
+		raise FilterError('$prefix expects a string')
+	escaped = value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+	return (escaped + '%',)
+
+
+@dataclass(frozen=True)
+class FilterOperator:
+	clause: Callable[..., Any]
+	prepare: Callable[[Any], tuple] = _single
+	arity: int = 1
+	expanding: bool = False
+
+	def param_names(self, name: str) -> list[str]:
+		return [name] if self.arity == 1 else [f'{name}_{j}' for j in range(self.arity)]
+
+	def bind(self, name: str, value: Any) -> dict[str, Any]:
+		return dict(zip(self.param_names(name), self.prepare(value)))
+
+	def condition(self, column: Any, name: str) -> Any:
+		return self.clause(column, *(bindparam(n, expanding=self.expanding) for n in self.param_names(name)))
+
+
+# Every operator compiles to a plain comparison on the bare column, so an index on it stays usable
+# ($prefix becomes LIKE 'abc%', which PostgreSQL can only serve from a C-collation/pattern_ops index).
+OPERATORS: dict[str, FilterOperator] = {
+	'$eq': FilterOperator(lambda column, value: column == value),
+	'$gt': FilterOperator(lambda column, value: column > value),
+	'$lt': FilterOperator(lambda column, value: column < value),
+	'$gte': FilterOperator(lambda column, value: column >= value),
+	'$lte': FilterOperator(lambda column, value: column <= value),
+	'$in': FilterOperator(lambda column, values: column.in_(values), _collection, expanding=True),
+	'$between': FilterOperator(lambda column, low, high: column.between(low, high), _range, arity=2),
+	'$prefix': FilterOperator(lambda column, pattern: column.like(pattern, escape='/'), _prefix),
+}
 
 
 class IRepository(ABC, Generic[T]):
@@ -33,10 +98,22 @@ class IRepository(ABC, Generic[T]):
 	async def delete(self, entity_id: int) -> bool:
 		pass
 
+	@abstractmethod
+	async def delete_many_returning(self, entity_ids: list[int], filters: Optional[dict[str, any]] = None) -> List[T]:
+		pass
+
 	@abstractmethod
 	async def add(self, obj_in: T) -> T:
 		pass
 
+	@abstractmethod
+	async def add_many(self, objs_in: list[T]) -> List[T]:
+		pass
+
+	@abstractmethod
+	async def add_many_ignoring_existing(self, rows: list[dict[str, Any]]) -> int:
+		pass
+
 	@abstractmethod
 	async def find_one_by(
 		self,
@@ -56,6 +133,17 @@ class IRepository(ABC, Generic[T]):
 	) -> List[T]:
 		pass
 
+	@abstractmethod
+	async def find_page_by(
+		self,
+		filters: dict[str, any],
+		limit: int,
+		after: Optional[Sequence[Any]] = None,
+		keys: Optional[list[str]] = None,
+		descending: bool = False,
+	) -> tuple[List[T], Optional[tuple]]:
+		pass
+
 	@abstractmethod
 	async def count_by(
 		self,
@@ -102,63 +190,188 @@ class BaseRepository(IRepository[T], Generic[T]):
 		result = await self.db_session.execute(stmt)
 		return result.scalars().all()
 
+	@property
+	def dialect(self):
+		return self.db_session.bind.dialect
+
 	async def upd(self, entity_id: int, **kwargs) -> Optional[T]:
-		obj = await self.find_one(entity_id)
-		if obj:
-			for key, value in kwargs.items():
-				setattr(obj, key, value)
+		stmt = update(self.model).where(self.model.id == entity_id).values(**kwargs)
+
+		if self.dialect.update_returning:
+			stmt = stmt.returning(self.model).execution_options(synchronize_session=False)
+			obj = (await self.db_session.scalars(stmt)).one_or_none()
 			await self.db_session.commit()
-			await self.db_session.refresh(obj)
-		return obj
+			return obj
+
+		result = await self.db_session.execute(stmt.execution_options(synchronize_session=False))
+		await self.db_session.commit()
+		return await self.find_one(entity_id) if result.rowcount else None
 
+	# Bulk DELETE statements skip ORM-level cascades; models relying on them must go through session.delete
 	async def delete(self, entity_id: int) -> bool:
-		obj = await self.find_one(entity_id)
-		if obj:
-			await self.db_session.delete(obj)
+		stmt = delete(self.model).where(self.model.id == entity_id).execution_options(synchronize_session=False)
+		result = await self.db_session.execute(stmt)
+		await self.db_session.commit()
+		return bool(result.rowcount)
+
+	async def delete_many_returning(self, entity_ids: list[int], filters: Optional[dict[str, any]] = None) -> List[T]:
+		spec, params = self._split_filters({**(filters or {}), 'id': {'$in': entity_ids}})
+		conditions, _, names = self._filter_conditions(spec)
+		params = {name: params[name] for name in names}
+
+		if not self.dialect.delete_returning:
+			stmt = select(self.model).where(*conditions).with_for_update()
+			objs = (await self.db_session.scalars(stmt, params)).all()
+			if objs:
+				stmt = delete(self.model).where(self.model.id.in_([obj.id for obj in objs]))
+				await self.db_session.execute(stmt.execution_options(synchronize_session=False))
 			await self.db_session.commit()
-			return True
-		return False
+			return objs
+
+		stmt = delete(self.model).where(*conditions).returning(self.model).execution_options(synchronize_session=False)
+		objs = (await self.db_session.scalars(stmt, params)).all()
+		await self.db_session.commit()
+		return objs
 
 	async def add(self, obj_in: T) -> T:
+		# The flush fetches the new primary key itself (INSERT ... RETURNING where the dialect has it,
+		# cursor.lastrowid elsewhere) and expire_on_commit=False keeps the attributes loaded,
+		# so no refresh SELECT is needed.
 		self.db_session.add(obj_in)
 		await self.db_session.commit()
-		await self.db_session.refresh(obj_in)
 		return obj_in
 
+	async def add_many(self, objs_in: list[T]) -> List[T]:
+		# One flush, one transaction. Where the dialect has INSERT ... RETURNING (PostgreSQL, SQLite, MariaDB)
+		# the ORM sends the rows as batched multi-row INSERTs; MySQL has no RETURNING, so it needs each row's
+		# cursor.lastrowid and sends one INSERT per row. A core multi-row INSERT could not report the new ids
+		# there: LAST_INSERT_ID() only gives the first one, and the rest need not be consecutive.
+		await AsyncSessionUtil(self.db_session).batch_save(objs_in)
+		await self.db_session.commit()
+		return objs_in
+
+	async def add_many_ignoring_existing(self, rows: list[dict[str, Any]]) -> int:
+		"""
+		One multi-row INSERT of rows that carry their own ids; rows whose id already exists are skipped,
+		so replaying the same rows is harmless. Returns the number of rows actually inserted.
+		"""
+		if not rows:
+			return 0
+
+		dialect = self.dialect.name
+		if dialect == 'postgresql':
+			stmt = postgresql.insert(self.model).on_conflict_do_nothing(index_elements=['id'])
+		elif dialect == 'sqlite':
+			stmt = sqlite.insert(self.model).on_conflict_do_nothing(index_elements=['id'])
+		else:
+			existing = set(await self.db_session.scalars(
+				select(self.model.id).where(self.model.id.in_([row['id'] for row in rows]))
+			))
+			rows = [row for row in rows if row['id'] not in existing]
+			if not rows:
+				return 0
+			if dialect in ('mysql', 'mariadb'):
+				# Not INSERT IGNORE: that also turns foreign key and data errors into warnings. This only
+				# ignores a duplicate id inserted since the SELECT. The connection reports found rows as
+				# affected, so rowcount can't tell duplicates apart; the SELECT above does.
+				stmt = mysql.insert(self.model).on_duplicate_key_update(id=self.model.id)
+			else:
+				stmt = insert(self.model)
+
+		result = await self.db_session.execute(stmt.values(rows))
+
+		if dialect == 'postgresql':
+			# Explicit ids don't advance the serial sequence; keep it ahead so plain INSERTs don't collide later
+			sequence = f"pg_get_serial_sequence('{self.model.__tablename__}', 'id')"
+			await self.db_session.execute(
+				text(f"SELECT setval({sequence}, GREATEST(:max_id, nextval({sequence})))"),
+				{'max_id': max(row['id'] for row in rows)},
+			)
+
+		await self.db_session.commit()
+		return len(rows) if dialect in ('mysql', 'mariadb') else result.rowcount
+
+	@staticmethod
+	def _split_filters(filters: dict[str, any]) -> tuple[FilterSpec, dict[str, Any]]:
+		"""
+		Splits ``{"field": value, "field": {"$op": value}}`` into the statement shape and its bound values.
+		Dotted fields (``"user.login"``) address a column of one of the models passed as join_models.
+		"""
+		spec, params = [], {}
+		for field, value in filters.items():
+			operations = value.items() if isinstance(value, dict) else (('$eq', value),)
+			for op, op_value in operations:
+				if op not in OPERATORS:
+					raise FilterError(f'Unknown filter operator {op!r} for {field!r}')
+				params.update(OPERATORS[op].bind(f'p{len(spec)}', op_value))
+				spec.append((field, op))
+		return tuple(spec), params
+
+	def _resolve_column(self, field: str, join_models: Optional[list[Callable]]) -> tuple[Any, Any]:
+		parts = field.split('.')
+
+		if len(parts) == 1:
+			model, column_name, join_model = self.model, parts[0], None
+		elif len(parts) == 2:
+			related_model_name, column_name = parts
+			model = join_model = next(
+				(m for m in join_models or [] if m.__name__.lower() == related_model_name.lower()),
+				None,
+			)
+			if model is None:
+				raise FilterError(f'Filter {field!r} refers to a model that is not in join_models')
+		else:
+			raise FilterError(f'Unsupported filter {field!r}')
+
+		if column_name not in inspect(model).column_attrs:
+			raise FilterError(f'{model.__name__} has no column {column_name!r}')
+
+		return getattr(model, column_name), join_model
+
+	def _filter_conditions(
+		self,
+		spec: FilterSpec,
+		join_models: Optional[list[Callable]] = None,
+	) -> tuple[list, list, set[str]]:
+		conditions, joins, names = [], [], set()
+		for i, (field, op) in enumerate(spec):
+			column, join_model = self._resolve_column(field, join_models)
+
+			if join_model is not None and join_model not in joins:
+				joins.append(join_model)
+
+			operator = OPERATORS[op]
+			conditions.append(operator.condition(column, f'p{i}'))
+			names.update(operator.param_names(f'p{i}'))
+		return conditions, joins, names
+
+	def _template(self, key: tuple, build: Callable[[], tuple[Select, set[str]]]) -> tuple[Select, frozenset[str]]:
+		key = (self.model, *key)
+		if key not in _statement_cache:
+			stmt, names = build()
+			_statement_cache[key] = (stmt, frozenset(names))
+		return _statement_cache[key]
+
+	async def _execute_template(self, template: tuple[Select, frozenset[str]], params: dict[str, Any]) -> Result:
+		stmt, names = template
+		return await self.db_session.execute(stmt, {name: params[name] for name in names})
+
 	async def find_one_by(
 		self,
 		filters: dict[str, any],
 		join_models: Optional[list[Callable]] = None,
 	) -> Optional[T]:
-		stmt = select(self.model)
-
-		filter_conditions = []
-		for field, value in filters.items():
-			parts = field.split('.')
+		spec, params = self._split_filters(filters)
 
-			if len(parts) > 1:
-				related_model_name = parts[0]
-				column_name = parts[1]
-
-				join_model_list = []
-				for model in join_models:
-					if model.__name__.lower() == related_model_name.lower():
-						join_model_list.append(model)
-						break
-
-				for join_model in join_model_list:
-					stmt = stmt.join(join_model)
-
-					column = getattr(join_model, column_name)
-					filter_conditions.append(column == value)
-			else:
-				column = getattr(self.model, parts[0], None)
-				if column:
-					filter_conditions.append(column == value)
-
-		stmt = stmt.where(and_(*filter_conditions))
+		def build():
+			conditions, joins, names = self._filter_conditions(spec, join_models)
+			stmt = select(self.model)
+			for join_model in joins:
+				stmt = stmt.join(join_model)
+			return stmt.where(and_(*conditions)), names
 
-		result = await self.db_session.execute(stmt)
+		template = self._template(('one', spec, tuple(join_models or ())), build)
+		result = await self._execute_template(template, params)
 		return result.scalar_one_or_none()
 
 	async def find_all_by(
@@ -171,93 +384,137 @@ class BaseRepository(IRepository[T], Generic[T]):
 		group_by: Optional[list[str]] = None,
 		eager_load: Optional[List[str]] = None
 	) -> List[T]:
-		stmt = select(self.model)
-
-		if join_models:
-			for join_model in join_models:
-				stmt = stmt.join(join_model)
-
-		filter_conditions = []
-		for field, value in filters.items():
-			parts = field.split('.')
+		spec, params = self._split_filters(filters)
+		params.update(limit=limit, offset=offset)
 
-			if len(parts) > 1:
-				related_model_name = parts[0]
-				column_name = parts[1]
+		def build():
+			conditions, _, names = self._filter_conditions(spec, join_models)
+			stmt = select(self.model)
 
-				join_model_list = List[None]
-				for model in join_models:
-					if model.__name__.lower() == related_model_name.lower():
-						join_model_list.append(model)
-						break
-
-				for join_model in join_model_list:
-					stmt = stmt.join(join_model)
-
-					column = getattr(join_model, column_name)
-					filter_conditions.append(column == value)
-			else:
-				column = getattr(self.model, parts[0], None)
-				if column:
-					filter_conditions.append(column == value)
-
-		if 'timestamp' in filters:
-			start_date, end_date = filters['timestamp']
-			stmt = stmt.where(self.model.timestamp >= start_date, self.model.timestamp <= end_date)
+			for join_model in join_models or []:
+				stmt = stmt.join(join_model)
 
-		stmt = stmt.where(and_(*filter_conditions))
+			stmt = stmt.where(and_(*conditions))
 
-		if eager_load:
-			for relation in eager_load:
+			for relation in eager_load or []:
 				stmt = stmt.options(joinedload(getattr(self.model, relation)))
 
-		if group_by:
-			stmt = stmt.group_by(column)
-
-		if order_by:
-			order_conditions = []
-			for field, direction in order_by.items():
-				column = getattr(self.model, field)
-				if direction == 'desc':
-					order_conditions.append(desc(column))
-				else:
-					order_conditions.append(asc(column))
-			stmt = stmt.order_by(*order_conditions)
+			if group_by:
+				stmt = stmt.group_by(*(getattr(self.model, key) for key in group_by))
+
+			if order_by:
+				stmt = stmt.order_by(*(
+					desc(getattr(self.model, field)) if direction == 'desc' else asc(getattr(self.model, field))
+					for field, direction in order_by.items()
+				))
+
+			if limit is not None:
+				stmt = stmt.limit(bindparam('limit', type_=Integer))
+				names.add('limit')
+
+			if offset is not None:
+				stmt = stmt.offset(bindparam('offset', type_=Integer))
+				names.add('offset')
+
+			return stmt, names
+
+		template = self._template(
+			(
+				'all',
+				spec,
+				tuple(join_models or ()),
+				tuple((order_by or {}).items()),
+				tuple(group_by or ()),
+				tuple(eager_load or ()),
+				limit is not None,
+				offset is not None,
+			),
+			build,
+		)
+		result = await self._execute_template(template, params)
+		return result.scalars().all()
 
-		if limit is not None:
-			stmt = stmt.limit(limit)
+	async def find_page_by(
+		self,
+		filters: dict[str, any],
+		limit: int,
+		after: Optional[Sequence[Any]] = None,
+		keys: Optional[list[str]] = None,
+		descending: bool = False,
+	) -> tuple[List[T], Optional[tuple]]:
+		"""Keyset page ordered by ``keys``; returns the rows and the key values to resume after."""
+		keys = keys or ['id']
+
+		if after is not None and len(after) != len(keys):
+			raise ValueError(f'Cursor has {len(after)} values, expected {len(keys)}')
+
+		spec, params = self._split_filters(filters)
+		params['limit'] = limit + 1
+		params.update({f'after{i}': value for i, value in enumerate(after or ())})
+
+		def build():
+			conditions, _, names = self._filter_conditions(spec)
+			key_columns = [getattr(self.model, key) for key in keys]
+			stmt = select(self.model).where(and_(*conditions))
+
+			if after is not None:
+				boundary = [bindparam(f'after{i}', type_=column.type) for i, column in enumerate(key_columns)]
+				position = key_columns[0] if len(keys) == 1 else tuple_(*key_columns)
+				boundary = boundary[0] if len(keys) == 1 else tuple_(*boundary)
+				stmt = stmt.where(position < boundary if descending else position > boundary)
+				names.update(f'after{i}' for i in range(len(keys)))
+
+			direction = desc if descending else asc
+			stmt = stmt.order_by(*(direction(column) for column in key_columns))
+			stmt = stmt.limit(bindparam('limit', type_=Integer))
+			names.add('limit')
+			return stmt, names
+
+		template = self._template(('page', spec, tuple(keys), descending, after is not None), build)
+		result = await self._execute_template(template, params)
+		rows = result.scalars().all()
+
+		if len(rows) <= limit:
+			return rows, None
+
+		rows = rows[:limit]
+		return rows, tuple(getattr(rows[-1], key) for key in keys)
+
+	async def stream_all_by(
+		self,
+		filters: dict[str, any],
+		keys: Optional[list[str]] = None,
+		batch_size: int = 500,
+	) -> AsyncIterator[T]:
+		spec, params = self._split_filters(filters)
+		conditions, _, names = self._filter_conditions(spec)
 
-		if offset is not None:
-			stmt = stmt.offset(offset)
+		stmt = select(self.model).where(and_(*conditions))
+		stmt = stmt.order_by(*(getattr(self.model, key) for key in keys or ['id']))
+		stmt = stmt.execution_options(yield_per=batch_size)
 
-		result = await self.db_session.execute(stmt)
-		return result.scalars().all()
+		result = await self.db_session.stream_scalars(stmt, {name: params[name] for name in names})
+		async for row in result:
+			yield row
 
 	async def count_by(
 		self,
 		filters: dict = {},
 		group_by: Optional[list[str]] = None,
 	) -> int:
-		stmt = select(func.count()).select_from(self.model)
-
-		if filters:
-			for key, value in filters.items():
-				column = getattr(self.model, key)
-				if isinstance(value, dict):
-					for op, op_value in value.items():
-						if op == '$gt':
-							stmt = stmt.filter(column > op_value)
-						elif op == '$lt':
-							stmt = stmt.filter(column < op_value)
-				else:
-					stmt = stmt.filter(column == value)
+		spec, params = self._split_filters(filters)
 
+		def build():
+			conditions, _, names = self._filter_conditions(spec)
+			stmt = select(func.count()).select_from(self.model).where(and_(*conditions))
 
-		if group_by:
-			for key in group_by:
+			for key in group_by or []:
 				stmt = stmt.group_by(getattr(self.model, key))
 
-		result = await self.db_session.execute(stmt)
+			return stmt, names
+
+		template = self._template(('count', spec, tuple(group_by or ())), build)
+		result = await self._execute_template(template, params)
 		return result.scalar()
 
 
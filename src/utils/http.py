@@ -0,0 +1,10 @@
+from typing import Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+	"""Weak comparison as RFC 9110 prescribes for If-None-Match."""
+	if not if_none_match:
+		return False
+
+	candidates = [tag.strip() for tag in if_none_match.split(',')]
+	return '*' in candidates or etag in (tag.removeprefix('W/') for tag in candidates)
@@ -0,0 +1,169 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+@dataclass
+class RequestStats:
+	"""What one request spent its time on; filled in by the SQL, Redis and span hooks."""
+	sql_count: int = 0
+	sql_seconds: float = 0.0
+	redis_count: int = 0
+	redis_seconds: float = 0.0
+	spans: dict[str, float] = field(default_factory=dict)
+
+
+request_stats_var: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+	"""Adds the time spent in the block to the current request under `name`."""
+	stats = request_stats_var.get()
+	if stats is None:
+		yield
+		return
+	started = time.perf_counter()
+	try:
+		yield
+	finally:
+		stats.spans[name] = stats.spans.get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def redis_call() -> Iterator[None]:
+	stats = request_stats_var.get()
+	if stats is None:
+		yield
+		return
+	started = time.perf_counter()
+	try:
+		yield
+	finally:
+		stats.redis_count += 1
+		stats.redis_seconds += time.perf_counter() - started
+
+
+def record_sql(seconds: float) -> None:
+	stats = request_stats_var.get()
+	if stats is not None:
+		stats.sql_count += 1
+		stats.sql_seconds += seconds
+
+
+class Histogram:
+	def __init__(self, buckets: tuple[float, ...]):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def render(self, name: str, labels: str) -> Iterator[str]:
+		cumulative = 0
+		for bound, count in zip(self.buckets, self.counts):
+			cumulative += count
+			yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+		yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+		yield f'{name}_sum{{{labels}}} {self.sum}'
+		yield f'{name}_count{{{labels}}} {self.count}'
+
+
+HISTOGRAMS = {
+	"http_request_duration_seconds": ("Total request latency", LATENCY_BUCKETS),
+	"http_request_sql_statements": ("SQL statements executed per request", COUNT_BUCKETS),
+	"http_request_sql_seconds": ("Time spent in SQL per request", LATENCY_BUCKETS),
+	"http_request_redis_calls": ("Redis round trips per request", COUNT_BUCKETS),
+	"http_request_redis_seconds": ("Time spent in Redis per request", LATENCY_BUCKETS),
+	"http_request_span_seconds": ("Time spent in named spans (auth, db checkout) per request", LATENCY_BUCKETS),
+}
+
+# (metric, labels) -> histogram; labels are pre-rendered so they are only built once per series
+_series: dict[tuple[str, str], Histogram] = {}
+
+
+def _observe(metric: str, labels: str, value: float) -> None:
+	histogram = _series.get((metric, labels))
+	if histogram is None:
+		histogram = _series[(metric, labels)] = Histogram(HISTOGRAMS[metric][1])
+	histogram.observe(value)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+	labels = f'method="{method}",route="{route}",status="{status}"'
+	_observe("http_request_duration_seconds", labels, seconds)
+	_observe("http_request_sql_statements", labels, stats.sql_count)
+	_observe("http_request_sql_seconds", labels, stats.sql_seconds)
+	_observe("http_request_redis_calls", labels, stats.redis_count)
+	_observe("http_request_redis_seconds", labels, stats.redis_seconds)
+	for name, span_seconds in stats.spans.items():
+		_observe("http_request_span_seconds", f'{labels},span="{name}"', span_seconds)
+
+
+def render_histograms() -> Iterator[str]:
+	for metric, (description, _) in HISTOGRAMS.items():
+		yield f"# HELP {metric} {description}"
+		yield f"# TYPE {metric} histogram"
+		for (name, labels), histogram in sorted(_series.items()):
+			if name == metric:
+				yield from histogram.render(metric, labels)
+
+
+def server_timing(total_seconds: float, stats: RequestStats) -> str:
+	parts = [
+		f'sql;dur={stats.sql_seconds * 1000:.3f};desc="{stats.sql_count} statements"',
+		f'redis;dur={stats.redis_seconds * 1000:.3f};desc="{stats.redis_count} calls"',
+		*(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stats.spans.items()),
+		f"total;dur={total_seconds * 1000:.3f}",
+	]
+	return ", ".join(parts)
+
+
+class InstrumentationMiddleware:
+	"""Pure ASGI middleware: per-route histograms plus a Server-Timing header on every response."""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		stats = RequestStats()
+		token = request_stats_var.set(stats)
+		started = time.perf_counter()
+		status = 500
+
+		async def send_with_timing(message):
+			nonlocal status
+			if message["type"] == "http.response.start":
+				status = message["status"]
+				timing = server_timing(time.perf_counter() - started, stats)
+				message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_with_timing)
+		finally:
+			# The router leaves the matched route in the scope; unmatched paths share one label
+			route = scope.get("route")
+			observe_request(
+				scope["method"],
+				getattr(route, "path", "unmatched"),
+				status,
+				time.perf_counter() - started,
+				stats,
+			)
+			request_stats_var.reset(token)
@@ -0,0 +1,215 @@
+import atexit
+import json
+import logging
+import queue
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from config import LoggingParams
+
+try:
+	import fcntl
+except ImportError:  # Windows: rollovers are still coordinated through the state file, just not locked
+	fcntl = None
+
+
+TEXT_FORMAT = u'%(filename)s [LINE:%(lineno)d] #%(levelname)-8s [%(asctime)s]  %(message)s'
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_listener: QueueListener | None = None
+
+
+class RequestContextFilter(logging.Filter):
+	"""Copies the current request id onto the record; handler filters run in the caller, before the queue."""
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		record.request_id = request_id_var.get()
+		return True
+
+
+class LightQueueHandler(QueueHandler):
+	"""QueueHandler that only renders the message in the caller and leaves all other formatting to the listener."""
+
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		# The root logger has no other handler, so the record is not copied before it is changed
+		record.msg = record.getMessage()
+		record.args = None
+		if record.exc_info:
+			record.exc_text = logging.Formatter().formatException(record.exc_info)
+			record.exc_info = None
+		return record
+
+
+class JsonFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		entry = {
+			"ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+			"level": record.levelname,
+			"logger": record.name,
+			"message": record.getMessage(),
+			"request_id": getattr(record, "request_id", None),
+		}
+		latency_ms = getattr(record, "latency_ms", None)
+		if latency_ms is not None:
+			entry["latency_ms"] = latency_ms
+		if record.exc_text:
+			entry["exc_info"] = record.exc_text
+		return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BufferedTimedRotatingFileHandler(TimedRotatingFileHandler):
+	"""
+	TimedRotatingFileHandler that writes through to the file once per batch instead of once per record.
+
+	Every worker process has one of these on the same file. The first to reach a rollover renames the file
+	and notes it in `<file>.rotation`; the others then only reopen the file, where the stock handler would
+	rename it again and remove the backup that was just made.
+	"""
+
+	def __init__(self, *args, batch_size: int = 100, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.batch_size = batch_size
+		self._pending = 0
+
+	def flush(self) -> None:
+		# StreamHandler.emit calls this after every record
+		self._pending += 1
+		if self._pending >= self.batch_size:
+			self.flush_now()
+
+	def flush_now(self) -> None:
+		self._pending = 0
+		super().flush()
+
+	def doRollover(self) -> None:
+		with open(f"{self.baseFilename}.rotation", "a+") as state:
+			if fcntl is not None:
+				# Held until the file is closed, so rollovers of different processes run one after another
+				fcntl.flock(state, fcntl.LOCK_EX)
+			state.seek(0)
+			rotated_at = state.read().strip()
+
+			if rotated_at and float(rotated_at) >= self.rolloverAt:
+				# Another process has rotated this period already; continue in the file it started
+				if self.stream:
+					self.stream.close()
+					self.stream = None
+				self.rolloverAt = self.computeRollover(int(time.time()))
+				return
+
+			rollover_at = self.rolloverAt
+			super().doRollover()
+			state.seek(0)
+			state.truncate()
+			state.write(str(rollover_at))
+
+	def close(self) -> None:
+		self.flush_now()
+		super().close()
+
+
+class BatchingQueueListener(QueueListener):
+	"""QueueListener that flushes its handlers whenever the queue has been idle for `flush_interval` seconds."""
+
+	def __init__(self, log_queue, *handlers, flush_interval: float = 1.0, respect_handler_level: bool = False):
+		super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+		self.flush_interval = flush_interval
+
+	def dequeue(self, block: bool) -> logging.LogRecord:
+		while True:
+			try:
+				return self.queue.get(block, timeout=self.flush_interval)
+			except queue.Empty:
+				self.flush_handlers()
+
+	def flush_handlers(self) -> None:
+		for handler in self.handlers:
+			if isinstance(handler, BufferedTimedRotatingFileHandler):
+				handler.flush_now()
+			else:
+				handler.flush()
+
+
+def configure_logging(params: LoggingParams) -> QueueListener:
+	"""Routes the root logger through a queue; formatting and file I/O happen on the listener's thread."""
+	global _listener
+	if _listener is not None:
+		return _listener
+
+	handler = BufferedTimedRotatingFileHandler(
+		params.file,
+		when=params.rotate_when,
+		backupCount=params.backup_count,
+		encoding="utf-8",
+		delay=True,
+		batch_size=params.batch_size,
+	)
+	handler.setFormatter(JsonFormatter() if params.format == "json" else logging.Formatter(TEXT_FORMAT))
+
+	log_queue: queue.SimpleQueue = queue.SimpleQueue()
+	queue_handler = LightQueueHandler(log_queue)
+	queue_handler.addFilter(RequestContextFilter())
+
+	root = logging.getLogger()
+	root.setLevel(params.level)
+	root.addHandler(queue_handler)
+
+	_listener = BatchingQueueListener(log_queue, handler, flush_interval=params.flush_interval)
+	_listener.start()
+	atexit.register(shutdown_logging)
+	return _listener
+
+
+def shutdown_logging() -> None:
+	"""Drains the queue and closes the file; safe to call more than once."""
+	global _listener
+	if _listener is None:
+		return
+	_listener.stop()
+	for handler in _listener.handlers:
+		handler.close()
+	for handler in logging.getLogger().handlers[:]:
+		if isinstance(handler, QueueHandler) and handler.queue is _listener.queue:
+			logging.getLogger().removeHandler(handler)
+	_listener = None
+
+
+class RequestLogMiddleware:
+	"""Pure ASGI middleware: assigns a request id (or takes X-Request-ID) and logs one access line with latency."""
+
+	def __init__(self, app, access_log: bool = True):
+		self.app = app
+		self.access_log = access_log
+		self.log = logging.getLogger("access")
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		request_id = dict(scope["headers"]).get(b"x-request-id", b"")[:64].decode("latin-1") or uuid.uuid4().hex
+		token = request_id_var.set(request_id)
+		started = time.perf_counter()
+		status = 500
+
+		async def send_with_request_id(message):
+			nonlocal status
+			if message["type"] == "http.response.start":
+				status = message["status"]
+				message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_with_request_id)
+		finally:
+			if self.access_log:
+				latency_ms = round((time.perf_counter() - started) * 1000, 3)
+				self.log.info(
+					"%s %s %s %.3fms", scope["method"], scope["path"], status, latency_ms,
+					extra={"latency_ms": latency_ms},
+				)
+			request_id_var.reset(token)
@@ -0,0 +1,106 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+	def __init__(self, max_size: int):
+		self.max_size = max_size
+		self._data: OrderedDict[K, V] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def __contains__(self, key: K) -> bool:
+		return key in self._data
+
+	def get(self, key: K) -> Optional[V]:
+		try:
+			self._data.move_to_end(key)
+		except KeyError:
+			return None
+		return self._data[key]
+
+	def set(self, key: K, value: V) -> None:
+		if self.max_size <= 0:
+			return
+		self._data[key] = value
+		self._data.move_to_end(key)
+		while len(self._data) > self.max_size:
+			self._data.popitem(last=False)
+
+	def pop(self, key: K) -> Optional[V]:
+		return self._data.pop(key, None)
+
+	def clear(self) -> None:
+		self._data.clear()
+
+
+def _sizeof(value: Any) -> int:
+	if isinstance(value, (bytes, bytearray, str)):
+		return len(value)
+	return sys.getsizeof(value)
+
+
+class TaggedTTLCache:
+	"""LRU bounded by the total size of its values, with a per-entry TTL.
+
+	Entries are filed under a tag so everything cached for one Redis key can be dropped at once.
+	"""
+
+	def __init__(self, max_bytes: int, ttl: float):
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.size = 0
+		self._data: OrderedDict[tuple[str, Hashable], tuple[Any, float, int]] = OrderedDict()
+		self._tags: dict[str, set[Hashable]] = {}
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def get(self, tag: str, key: Hashable) -> Any:
+		entry = self._data.get((tag, key))
+		if entry is None:
+			return None
+		value, expires_at, _ = entry
+		if expires_at <= time.monotonic():
+			self._remove((tag, key))
+			return None
+		self._data.move_to_end((tag, key))
+		return value
+
+	def set(self, tag: str, key: Hashable, value: Any) -> None:
+		size = _sizeof(value)
+		if size > self.max_bytes:
+			return
+		self._remove((tag, key))
+		self._data[(tag, key)] = (value, time.monotonic() + self.ttl, size)
+		self._tags.setdefault(tag, set()).add(key)
+		self.size += size
+		while self.size > self.max_bytes:
+			self._remove(next(iter(self._data)))
+
+	def invalidate(self, tag: str) -> None:
+		for key in self._tags.pop(tag, ()):
+			_, _, size = self._data.pop((tag, key))
+			self.size -= size
+
+	def clear(self) -> None:
+		self._data.clear()
+		self._tags.clear()
+		self.size = 0
+
+	def _remove(self, entry_key: tuple[str, Hashable]) -> None:
+		entry = self._data.pop(entry_key, None)
+		if entry is None:
+			return
+		self.size -= entry[2]
+		tag, key = entry_key
+		keys = self._tags[tag]
+		keys.discard(key)
+		if not keys:
+			del self._tags[tag]
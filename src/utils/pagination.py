@@ -0,0 +1,43 @@
+import base64
+import binascii
+import json
+from typing import Any, Optional, Sequence
+
+
+# Cursor ints end up as bound parameters of INTEGER key columns; anything wider fails in the driver
+SQL_INT_MIN, SQL_INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+class InvalidCursor(ValueError):
+	pass
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+	raw = json.dumps(list(values), separators=(',', ':')).encode()
+	return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _matches(value: Any, expected: type) -> bool:
+	if expected is int:
+		return type(value) is int and SQL_INT_MIN <= value <= SQL_INT_MAX
+	return isinstance(value, expected)
+
+
+def decode_cursor(cursor: Optional[str], types: Sequence[type]) -> Optional[tuple]:
+	"""Key values encoded by encode_cursor; `types` is the type of each key column, in order."""
+	if not cursor:
+		return None
+
+	try:
+		raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+		values = json.loads(raw)
+	except (binascii.Error, ValueError) as e:
+		raise InvalidCursor(cursor) from e
+
+	# Cursors come from the client: a wrong shape must not reach the query
+	if not isinstance(values, list) or len(values) != len(types):
+		raise InvalidCursor(cursor)
+	if not all(_matches(value, expected) for value, expected in zip(values, types)):
+		raise InvalidCursor(cursor)
+
+	return tuple(values)
@@ -0,0 +1,54 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from config import get_config
+
+try:
+	import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+	orjson = None
+
+
+def _default(obj: Any) -> Any:
+	if isinstance(obj, BaseModel):
+		return obj.model_dump(mode='json')
+	raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+def _std_dumps(value: Any) -> bytes:
+	return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+@dataclass(frozen=True)
+class Serializer:
+	name: str
+	dumps: Callable[[Any], bytes]
+	loads: Callable[[bytes | str], Any]
+
+
+SERIALIZERS: dict[str, Serializer] = {
+	'json': Serializer('json', _std_dumps, json.loads),
+}
+
+if orjson is not None:
+	SERIALIZERS['orjson'] = Serializer('orjson', lambda value: orjson.dumps(value, default=_default), orjson.loads)
+
+
+def get_serializer(name: str = 'auto') -> Serializer:
+	if name == 'auto':
+		return SERIALIZERS.get('orjson', SERIALIZERS['json'])
+	if name not in SERIALIZERS:
+		raise ValueError(f'JSON serializer {name!r} is not available, choose from {sorted(SERIALIZERS)}')
+	return SERIALIZERS[name]
+
+
+serializer = get_serializer(get_config().general.json_serializer)
+
+
+class FastJSONResponse(JSONResponse):
+	def render(self, content: Any) -> bytes:
+		return serializer.dumps(content)
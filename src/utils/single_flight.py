@@ -0,0 +1,55 @@
+import asyncio
+import math
+import random
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+	"""Runs at most one loader per key in this process; concurrent callers await the same result."""
+
+	def __init__(self):
+		self._flights: dict[str, asyncio.Future] = {}
+
+	def in_flight(self, key: str) -> bool:
+		return key in self._flights
+
+	async def do(self, key: str, loader: Callable[[], Awaitable[T]]) -> T:
+		while key in self._flights:
+			flight = self._flights[key]
+			try:
+				return await asyncio.shield(flight)
+			except asyncio.CancelledError:
+				# the leader was cancelled (e.g. its client went away); take over unless we are cancelled ourselves
+				if not flight.cancelled():
+					raise
+
+		flight = asyncio.get_running_loop().create_future()
+		# followers may be gone by the time the loader fails; don't log the exception as never retrieved
+		flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+		self._flights[key] = flight
+
+		try:
+			result = await loader()
+		except asyncio.CancelledError:
+			flight.cancel()
+			raise
+		except BaseException as e:
+			flight.set_exception(e)
+			raise
+		else:
+			flight.set_result(result)
+			return result
+		finally:
+			del self._flights[key]
+
+
+def refresh_early(compute_ms: float, ttl_ms: float, beta: float = 1.0) -> bool:
+	"""
+	XFetch (Vattani et al.): refresh before expiry with a probability that grows as the TTL runs out
+	and with how long the value takes to recompute, so one caller refreshes instead of all at expiry.
+	"""
+	if ttl_ms < 0:
+		return False
+	return compute_ms * beta * -math.log(1.0 - random.random()) >= ttl_ms